@@ -0,0 +1,173 @@
+"""Import attendees' links from a CSV file before an event.
+
+    python attendee_import.py attendees.csv --errors import_errors.csv
+
+Rows are telegram_user_id,linkedin,instagram; a header row with those names is
+optional and may put the columns in any order. Cells are checked with the rules of
+the private setup flow (validation.py), so @username is accepted for Instagram. An
+empty cell leaves that link unchanged. The file is read row by row and written in
+chunks of IMPORT_BATCH_SIZE users with one multi-path update each, so files of any
+size are never held in memory. Rows that fail are reported with their line number.
+"""
+import os
+import sys
+import csv
+import asyncio
+import logging
+import argparse
+from dotenv import load_dotenv
+import validation
+import storage
+
+COLUMNS = ('telegram_user_id', 'linkedin', 'instagram')
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+
+class ImportReport:
+    """Counts of one import; errors go to the on_error callback as they are found"""
+
+    __slots__ = ('rows', 'imported', 'failed')
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+
+    def __str__(self):
+        return f"{self.rows} rows: {self.imported} imported, {self.failed} failed"
+
+class ErrorLog:
+    """on_error callback that writes rejected rows to a CSV file and keeps the first few to show"""
+
+    def __init__(self, file=None, keep: int = 10, echo: bool = False):
+        self.shown = []
+        self.keep = keep
+        self.echo = echo
+        self._writer = csv.writer(file) if file is not None else None
+        if self._writer:
+            self._writer.writerow(['line', 'telegram_user_id', 'error'])
+
+    def __call__(self, line_number: int, user_id: str, message: str):
+        if self._writer:
+            self._writer.writerow([line_number, user_id, message])
+        if len(self.shown) < self.keep:
+            self.shown.append(f"line {line_number}: {message}")
+        if self.echo:
+            print(f"line {line_number}: {message}", file=sys.stderr)
+
+def read_rows(lines):
+    """Yield (line_number, {column: cell}) for every non-blank row of a CSV stream"""
+    reader = csv.reader(lines)
+    columns = None
+    for cells in reader:
+        if not any(cell.strip() for cell in cells):
+            continue
+        if columns is None:
+            first = cells[0].strip()
+            if not first.isdigit():
+                # Header row: columns are taken by name
+                names = [cell.strip().lower() for cell in cells]
+                if COLUMNS[0] not in names:
+                    raise ValueError(f"Header has no {COLUMNS[0]} column")
+                columns = {name: names.index(name) for name in COLUMNS if name in names}
+                continue
+            columns = {name: index for index, name in enumerate(COLUMNS)}
+        yield reader.line_num, {
+            name: cells[index].strip() if index < len(cells) else ''
+            for name, index in columns.items()
+        }
+
+def parse_row(row: dict):
+    """(user_id, {platform: link}) for a row, or ValueError saying what is wrong"""
+    user_id = row.get('telegram_user_id', '')
+    if not (user_id.isascii() and user_id.isdigit()) or int(user_id) == 0:
+        raise ValueError(f"telegram_user_id must be a positive number, got {user_id!r}")
+    links = {}
+    if row.get('linkedin'):
+        links['linkedin'] = validation.linkedin_link(row['linkedin'])
+        if links['linkedin'] is None:
+            raise ValueError(f"Not a LinkedIn link (linkedin.com/in/username): {row['linkedin']!r}")
+    if row.get('instagram'):
+        links['instagram'] = validation.instagram_link(row['instagram'])
+        if links['instagram'] is None:
+            raise ValueError(f"Not an Instagram username or link (@username or instagram.com/username): {row['instagram']!r}")
+    if not links:
+        raise ValueError("No links")
+    return str(int(user_id)), links
+
+async def import_rows(rows, batch_size: int = IMPORT_BATCH_SIZE, on_error=None, dry_run: bool = False, on_saved=None):
+    """Validate (line_number, row) pairs and write the valid ones batch by batch.
+
+    on_error(line_number, user_id, message) is called for every row that is rejected
+    or whose batch could not be written, and on_saved({user_id: {platform: link}})
+    after every batch that was. With dry_run nothing is written.
+    """
+    report = ImportReport()
+    batch = {}
+    lines = {}
+
+    def reject(line_number, user_id, message):
+        report.failed += 1
+        if on_error is not None:
+            on_error(line_number, user_id, message)
+
+    async def flush():
+        if batch and not dry_run:
+            links = dict(batch)
+            try:
+                await storage.save_users_links(links)
+                if on_saved is not None:
+                    on_saved(links)
+            except Exception as e:
+                logging.error(f"Failed to import a batch of {len(batch)} users: {e}")
+                for user_id, numbers in lines.items():
+                    for line_number in numbers:
+                        reject(line_number, user_id, f"Write failed: {e}")
+                        report.imported -= 1
+        batch.clear()
+        lines.clear()
+
+    for line_number, row in rows:
+        report.rows += 1
+        try:
+            user_id, links = parse_row(row)
+        except ValueError as e:
+            reject(line_number, row.get('telegram_user_id', ''), str(e))
+            continue
+        # A user listed twice gets the later links
+        batch.setdefault(user_id, {}).update(links)
+        lines.setdefault(user_id, []).append(line_number)
+        report.imported += 1
+        if len(batch) >= batch_size:
+            await flush()
+    await flush()
+    return report
+
+async def import_file(path: str, batch_size: int = IMPORT_BATCH_SIZE, on_error=None, dry_run: bool = False, on_saved=None):
+    # utf-8-sig drops the byte order mark spreadsheet exports start with
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return await import_rows(read_rows(f), batch_size, on_error, dry_run, on_saved)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import attendees' LinkedIn/Instagram links from a CSV file")
+    parser.add_argument("path", help="CSV of telegram_user_id,linkedin,instagram")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Users per write")
+    parser.add_argument("--errors", help="Also write rejected rows to this CSV file")
+    parser.add_argument("--dry-run", action="store_true", help="Only validate the file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    errors_file = open(args.errors, "w", newline='') if args.errors else None
+    try:
+        report = asyncio.run(import_file(args.path, args.batch_size, ErrorLog(errors_file, echo=True), args.dry_run))
+    except ValueError as e:
+        raise SystemExit(f"{args.path}: {e}")
+    finally:
+        if errors_file:
+            errors_file.close()
+        storage.shutdown()
+    print(("Checked " if args.dry_run else "Imported ") + str(report))
+
+if __name__ == '__main__':
+    main()
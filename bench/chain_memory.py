@@ -0,0 +1,129 @@
+"""Measure memory per cached chain for each way the bot can hold one.
+
+    python bench/chain_memory.py --chains 500 --members 80
+    python bench/chain_memory.py --compare bench/results/chain_memory_<timestamp>.json
+
+Two layouts are built for the same synthetic chains and measured with tracemalloc:
+
+- firebase: the storage dicts for a chain (groups/, group_contributions/ and the
+  members' users/ entries) with decimal-string ids, as a baseline
+- chain_view: the ChainView the bot keeps hot, a models.Chain (member order and
+  contributions in arrays) plus the rendered lines, which hold names and links
+
+Every member has both links and a random subset of contributions; ids, names and
+links are generated so that no strings are shared between members. Results are
+written as JSON; pass --compare with an earlier result file to print the change.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import Platform, UserProfile
+import chain_view
+
+FIRST_USER_ID = 5000000000
+FIRST_CHAT_ID = -1001000000000
+
+def synthetic_chain(index: int, members: int, rng: random.Random):
+    """One chain in the Firebase layout: (chat_id, groups, contributions, users)"""
+    chat_id = str(FIRST_CHAT_ID - index)
+    groups, contributions, users = {}, {}, {}
+    for position in range(members):
+        uid = str(FIRST_USER_ID + index * members + position)
+        groups[uid] = 1700000000000000 + position
+        users[uid] = {
+            'linkedin': f"https://www.linkedin.com/in/attendee-{uid}",
+            'instagram': f"https://instagram.com/attendee_{uid}",
+        }
+        added = {platform: True for platform in ('linkedin', 'instagram') if rng.random() < 0.7}
+        if added:
+            contributions[uid] = added
+    return chat_id, groups, contributions, users
+
+def fetched(chain):
+    # A fresh copy as storage would return it, so each layout keeps its own strings
+    return json.loads(json.dumps(chain))
+
+def build_firebase(chain):
+    chat_id, groups, contributions, users = chain
+    return {'groups': groups, 'group_contributions': contributions, 'users': users}
+
+def build_chain_view(chain):
+    chat_id, groups, contributions, users = chain
+    view = chain_view.ChainView(chat_id)
+    for uid in groups:
+        view.set_member(
+            uid, f"Attendee {uid}", UserProfile.from_firebase(uid, users[uid]),
+            Platform.from_firebase(contributions.get(uid)),
+        )
+    return view
+
+LAYOUTS = {'firebase': build_firebase, 'chain_view': build_chain_view}
+
+def measure(build, chains: list):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # Only what the layout keeps counts; the fetched copies are freed as it goes
+    built = [build(fetched(chain)) for chain in chains]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del built
+    return after - before
+
+def compare(current: dict, previous: dict):
+    lines = []
+    for layout, result in current["layouts"].items():
+        before = previous.get("layouts", {}).get(layout)
+        if before:
+            lines.append(f"{layout:10} per chain: {before['per_chain_kib']:8.1f} -> {result['per_chain_kib']:8.1f} KiB")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chains", type=int, default=500)
+    parser.add_argument("--members", type=int, default=80, help="Members per chain")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Where to write the JSON result (default bench/results/)")
+    parser.add_argument("--compare", help="Earlier JSON result to compare with")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    chains = [synthetic_chain(index, args.members, rng) for index in range(args.chains)]
+    started = time.time()
+    layouts = {}
+    for name, build in LAYOUTS.items():
+        total = measure(build, chains)
+        layouts[name] = {
+            "per_chain_kib": round(total / args.chains / 1024, 2),
+            "per_member_bytes": round(total / (args.chains * args.members)),
+        }
+
+    result = {
+        "benchmark": "chain_memory",
+        "timestamp": int(started),
+        "params": {"chains": args.chains, "members": args.members, "seed": args.seed},
+        "layouts": layouts,
+    }
+    os.makedirs(os.path.join(ROOT, "bench", "results"), exist_ok=True)
+    output = args.output or os.path.join(ROOT, "bench", "results", f"chain_memory_{int(started)}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps(result, indent=2))
+    print(f"Saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(result, json.load(f)))
+
+if __name__ == '__main__':
+    main()
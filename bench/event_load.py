@@ -0,0 +1,206 @@
+"""Simulate a large networking event against the real handlers in bot.py.
+
+    python bench/event_load.py --users 500 --storage-latency 0.02 --api-latency 0.03
+
+The scenario runs three phases:
+
+1. every attendee sets up LinkedIn and Instagram through the private-chat flow
+2. one attendee runs /chain in the group
+3. everyone taps "Add Me" for both platforms, and every tenth attendee then taps "Remove Me"
+
+Telegram is replaced by an in-process fake Bot API and storage by the in-memory
+backend, each with configurable latency. For every phase the report gives p50/p95/p99
+handler latency, storage round trips and Bot API calls per update. It also records
+the run's peak traced memory. Results are written as JSON; pass --compare with an
+earlier result file to print the change.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+# Handler cost is measured without the outbound queue; set OUTBOUND_RATE_LIMIT=1 to
+# see how a burst drains under Telegram's flood limits
+os.environ.setdefault("OUTBOUND_RATE_LIMIT", "0")
+
+import bot
+import storage
+import chain_editor
+from storage.memory import MemoryBackend
+from bench.fakes import FakeBotRequest, callback_update, message_update
+
+GROUP_ID = -100123456
+FIRST_USER_ID = 100000
+
+def percentile(values: list, pct: float):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+class Phase:
+    def __init__(self, name: str, backend: MemoryBackend, request: FakeBotRequest):
+        self.name = name
+        self.backend = backend
+        self.request = request
+        self.latencies = []
+
+    def __enter__(self):
+        self._round_trips = self.backend.round_trips
+        self._calls = dict(self.request.calls)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        self.round_trips = self.backend.round_trips - self._round_trips
+        self.api_calls = {
+            method: count - self._calls.get(method, 0)
+            for method, count in self.request.calls.items()
+            if count - self._calls.get(method, 0)
+        }
+
+    def report(self):
+        updates = len(self.latencies) or 1
+        api_total = sum(self.api_calls.values())
+        return {
+            "updates": len(self.latencies),
+            "seconds": round(self.seconds, 3),
+            "latency_ms": {
+                "p50": round(percentile(self.latencies, 50) * 1000, 2),
+                "p95": round(percentile(self.latencies, 95) * 1000, 2),
+                "p99": round(percentile(self.latencies, 99) * 1000, 2),
+            },
+            "storage_round_trips": self.round_trips,
+            "storage_round_trips_per_update": round(self.round_trips / updates, 2),
+            "api_calls": self.api_calls,
+            "api_calls_per_update": round(api_total / updates, 2),
+        }
+
+async def dispatch(app, update, phase: Phase):
+    # Same path as live traffic: through the update processor, then the handlers
+    start = time.perf_counter()
+    await app.update_processor.process_update(update, app.process_update(update))
+    phase.latencies.append(time.perf_counter() - start)
+
+async def run_scenario(users: int, storage_latency: float, api_latency: float, edit_window: float, seed: int):
+    random.seed(seed)
+    backend = MemoryBackend(latency=storage_latency)
+    storage.set_backend(backend)
+    request = FakeBotRequest(latency=api_latency)
+    chain_editor.edits.window = edit_window
+    app = bot.build_application(token="123456:bench", request=request)
+    await app.initialize()
+    user_ids = [FIRST_USER_ID + i for i in range(users)]
+    results = {}
+
+    try:
+        # 1. Private setup through handle_link
+        with Phase("setup", backend, request) as setup:
+            async def set_up(uid):
+                for update in (
+                    callback_update(app.bot, uid, 'add_linkedin_btn'),
+                    message_update(app.bot, uid, f"https://linkedin.com/in/attendee{uid}"),
+                    callback_update(app.bot, uid, 'add_instagram_btn'),
+                    message_update(app.bot, uid, f"@attendee{uid}"),
+                ):
+                    await dispatch(app, update, setup)
+            await asyncio.gather(*(set_up(uid) for uid in user_ids))
+        results["setup"] = setup.report()
+
+        # 2. /chain in the group
+        with Phase("chain", backend, request) as chain:
+            await dispatch(app, message_update(app.bot, user_ids[0], "/chain", chat_id=GROUP_ID), chain)
+        results["chain"] = chain.report()
+        chain_message_id = next(
+            message["message_id"] for message in reversed(request.sent)
+            if message["chat"]["id"] == GROUP_ID
+        )
+
+        # 3. Burst of taps on the chain message
+        taps = [(uid, data) for uid in user_ids for data in ('add_linkedin', 'add_instagram')]
+        random.shuffle(taps)
+        taps += [(uid, 'remove_me') for uid in user_ids[::10]]
+        with Phase("burst", backend, request) as burst:
+            await asyncio.gather(*(
+                dispatch(app, callback_update(
+                    app.bot, uid, f"{data}:{chain_message_id}", chat_id=GROUP_ID, message_id=chain_message_id
+                ), burst)
+                for uid, data in taps
+            ))
+            # Edits and writes still pending after the last tap are part of the burst's cost
+            await chain_editor.edits.flush()
+            await storage.close_writes()
+        results["burst"] = burst.report()
+        results["burst"]["chain_edits"] = chain_editor.edits.stats()
+    finally:
+        await app.shutdown()
+    return results
+
+def compare(current: dict, previous: dict):
+    lines = []
+    for phase, report in current["phases"].items():
+        before = previous.get("phases", {}).get(phase)
+        if not before:
+            continue
+        for key in ("p50", "p95", "p99"):
+            old, new = before["latency_ms"][key], report["latency_ms"][key]
+            lines.append(f"{phase:6} {key}: {old:9.2f} -> {new:9.2f} ms")
+        for key in ("storage_round_trips_per_update", "api_calls_per_update"):
+            lines.append(f"{phase:6} {key}: {before[key]} -> {report[key]}")
+    old_peak, new_peak = previous.get("peak_memory_mb"), current["peak_memory_mb"]
+    lines.append(f"peak memory: {old_peak} -> {new_peak} MB")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--storage-latency", type=float, default=0.02, help="Seconds per storage call")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="Seconds per Bot API call")
+    parser.add_argument("--edit-window", type=float, default=1.0, help="Seconds between chain edits")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Where to write the JSON result (default bench/results/)")
+    parser.add_argument("--compare", help="Earlier JSON result to compare with")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    started = time.time()
+    phases = asyncio.run(run_scenario(args.users, args.storage_latency, args.api_latency, args.edit_window, args.seed))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "benchmark": "event_load",
+        "timestamp": int(started),
+        "params": {
+            "users": args.users,
+            "storage_latency": args.storage_latency,
+            "api_latency": args.api_latency,
+            "edit_window": args.edit_window,
+            "concurrent_updates": bot.CONCURRENT_UPDATES,
+        },
+        "phases": phases,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+    }
+
+    output = args.output or os.path.join(ROOT, "bench", "results", f"event_load_{int(started)}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps(result, indent=2))
+    print(f"Saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(result, json.load(f)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Drive bot.py against a local fake Telegram Bot API and compare update throughput.
+
+    python bench/fake_telegram.py --mode both --updates 500 --api-latency 0.05 --concurrent-updates 32
+    python bench/fake_telegram.py --mode polling --workers 3 --kill-worker
+
+The bot runs as a subprocess with in-memory storage. Its Bot API calls go to a fake
+server in this process. Updates arrive either through getUpdates (polling) or as
+webhook POSTs carrying the secret token. Each update is a /help command from a
+different user, so the run is complete once the fake API has seen one sendMessage
+per update.
+
+With --workers above 1 the bot runs a front process and that many worker processes
+(WORKERS), sharing a temporary SQLite database since that mode refuses in-memory
+storage. --kill-worker sends SIGKILL to one worker once half of the updates are
+answered; the run then checks that the rest are still answered and that the worker
+is restarted.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.fakes import fake_result
+
+TOKEN = "123456:fake-token"
+SECRET = "fake-secret"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def help_update(update_id: int, user_id: int):
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": "/help",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+        },
+    }
+
+class FakeBotAPI:
+    """Minimal threaded Bot API server answering the methods bot.py uses"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self.updates = []
+        self._cond = threading.Condition()
+        self.server = ThreadingHTTPServer(("127.0.0.1", free_port()), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/bot"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def count(self, method: str):
+        with self._cond:
+            return self.calls.get(method, 0)
+
+    def wait_for(self, method: str, count: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.calls.get(method, 0) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def enqueue(self, updates: list):
+        with self._cond:
+            self.updates.extend(updates)
+            self._cond.notify_all()
+
+    def _result(self, method: str, params: dict):
+        if method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            timeout = min(float(params.get("timeout") or 0), 1.0)
+            deadline = time.monotonic() + timeout
+            with self._cond:
+                while True:
+                    pending = [u for u in self.updates if u["update_id"] >= offset][:100]
+                    remaining = deadline - time.monotonic()
+                    if pending or remaining <= 0:
+                        return pending
+                    self._cond.wait(remaining)
+        return fake_result(method, params)
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(body or "{}")
+                else:
+                    params = {key: values[0] for key, values in parse_qs(body).items()}
+                if api.latency and method != "getUpdates":
+                    time.sleep(api.latency)
+                result = api._result(method, params)
+                with api._cond:
+                    api.calls[method] = api.calls.get(method, 0) + 1
+                    api._cond.notify_all()
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The bot went away mid long-poll while shutting down
+                    pass
+
+            do_GET = do_POST
+
+        return Handler
+
+def worker_pids(pid: int):
+    """Worker processes of the bot process pid (multiprocessing spawn children, Linux only)"""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except (OSError, ValueError, IndexError):
+            continue
+        # The spawn context also starts a resource tracker, which is not a worker
+        if parent == pid and b"spawn_main" in cmdline:
+            pids.append(int(entry))
+    return sorted(pids)
+
+def wait_until(condition, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+def start_bot(api: FakeBotAPI, mode: str, concurrent_updates: int, webhook_port: int,
+              workers: int = 1, directory: str = None):
+    storage_env = {"STORAGE_BACKEND": "memory"}
+    if workers > 1:
+        # Workers need storage shared between processes
+        storage_env = {"STORAGE_BACKEND": "sqlite", "SQLITE_PATH": os.path.join(directory, "bench.db")}
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_API_BASE_URL=api.base_url,
+        **storage_env,
+        WORKERS=str(workers),
+        # Measures update throughput, not Telegram's flood limits
+        OUTBOUND_RATE_LIMIT=os.environ.get("OUTBOUND_RATE_LIMIT", "0"),
+        BOT_MODE=mode,
+        CONCURRENT_UPDATES=str(concurrent_updates),
+        WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_SECRET=SECRET,
+        PORT=str(webhook_port),
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bot.py")],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+async def post_updates(webhook_port: int, updates: list, parallel: int):
+    url = f"http://127.0.0.1:{webhook_port}/telegram"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    limit = asyncio.Semaphore(parallel)
+    async with httpx.AsyncClient(timeout=30) as client:
+        # A request with the wrong secret must be refused before any real traffic is sent
+        rejected = await client.post(url, json=updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        if rejected.status_code != 403:
+            raise RuntimeError(f"Webhook accepted a bad secret token (HTTP {rejected.status_code})")
+
+        async def post(update):
+            async with limit:
+                response = await client.post(url, json=update, headers=headers)
+                response.raise_for_status()
+
+        await asyncio.gather(*(post(update) for update in updates))
+
+def run(mode: str, count: int, api_latency: float, concurrent_updates: int, timeout: float,
+        workers: int = 1, kill_worker: bool = False):
+    api = FakeBotAPI(latency=api_latency)
+    api.start()
+    webhook_port = free_port()
+    directory = tempfile.TemporaryDirectory()
+    bot = start_bot(api, mode, concurrent_updates, webhook_port, workers, directory.name)
+    result = {}
+    try:
+        ready_method = "setWebhook" if mode == "webhook" else "getUpdates"
+        if not api.wait_for(ready_method, 1, timeout):
+            raise RuntimeError(f"Bot did not start in {mode} mode")
+        # The front fetches updates before its workers are up; they wait there until one is
+        if workers > 1 and not wait_until(lambda: len(worker_pids(bot.pid)) == workers, timeout):
+            raise RuntimeError(f"Expected {workers} worker processes, found {len(worker_pids(bot.pid))}")
+
+        updates = [help_update(i + 1, 10_000 + i) for i in range(count)]
+        # With --kill-worker, one worker is killed between the two halves
+        batches = [updates[:count // 2], updates[count // 2:]] if kill_worker else [updates]
+        start = time.perf_counter()
+        finished = True
+        for number, batch in enumerate(batches):
+            if number == 1:
+                before = worker_pids(bot.pid)
+                os.kill(before[0], signal.SIGKILL)
+                result["killed_worker"] = before[0]
+            if mode == "webhook":
+                asyncio.run(post_updates(webhook_port, batch, parallel=64))
+            else:
+                api.enqueue(batch)
+            finished = api.wait_for("sendMessage", int(batch[-1]["update_id"]), timeout) and finished
+        elapsed = time.perf_counter() - start
+        if kill_worker:
+            result["worker_restarted"] = wait_until(
+                lambda: len(worker_pids(bot.pid)) == workers and before[0] not in worker_pids(bot.pid), timeout
+            )
+        return {
+            "mode": mode,
+            "workers": workers,
+            "updates": count,
+            "processed": api.count("sendMessage"),
+            "completed": finished,
+            "seconds": round(elapsed, 3),
+            "updates_per_second": round(api.count("sendMessage") / elapsed, 1),
+            "api_latency": api_latency,
+            "concurrent_updates": concurrent_updates,
+            **result,
+        }
+    finally:
+        bot.terminate()
+        try:
+            bot.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        api.stop()
+        directory.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["polling", "webhook", "both"], default="both")
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds per fake Bot API call")
+    parser.add_argument("--concurrent-updates", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes behind the front (WORKERS)")
+    parser.add_argument("--kill-worker", action="store_true", help="Kill a worker halfway and check it is replaced")
+    args = parser.parse_args()
+    if args.kill_worker and args.workers < 2:
+        parser.error("--kill-worker needs --workers 2 or more")
+
+    modes = ["polling", "webhook"] if args.mode == "both" else [args.mode]
+    results = [
+        run(mode, args.updates, args.api_latency, args.concurrent_updates, args.timeout, args.workers, args.kill_worker)
+        for mode in modes
+    ]
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
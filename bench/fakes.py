@@ -0,0 +1,102 @@
+"""In-process stand-ins for the Telegram Bot API, shared by the benchmark tools"""
+import json
+import time
+import asyncio
+import itertools
+from telegram import Update
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "LinkListBot", "username": "linklistbot_bot"}
+
+_message_ids = itertools.count(1000)
+
+def chat_dict(chat_id: int):
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"}
+    return {"id": chat_id, "type": "supergroup", "title": f"Group{-chat_id}"}
+
+def fake_result(method: str, params: dict):
+    """Plausible `result` payload for a Bot API method called with params"""
+    if method == "getMe":
+        return BOT_USER
+    if method in ("sendMessage", "editMessageText", "sendDocument"):
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": int(params.get("message_id") or next(_message_ids)),
+            "date": int(time.time()),
+            "chat": chat_dict(chat_id),
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+    if method == "getChat":
+        return chat_dict(int(params.get("chat_id") or 0))
+    if method == "getUpdates":
+        return []
+    return True
+
+class FakeBotRequest(BaseRequest):
+    """BaseRequest that answers every Bot API call locally after `latency` seconds"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self.sent = []
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.json_parameters if request_data is not None else {}
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = fake_result(api_method, params)
+        if api_method == "sendMessage":
+            self.sent.append(result)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+# ------------- Update builders -------------
+_update_ids = itertools.count(1)
+
+def user_dict(user_id: int):
+    return {"id": user_id, "is_bot": False, "first_name": "User", "last_name": str(user_id)}
+
+def message_update(bot, user_id: int, text: str, chat_id: int = None):
+    chat_id = chat_id or user_id
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": chat_dict(chat_id),
+        "from": user_dict(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return Update.de_json({"update_id": next(_update_ids), "message": message}, bot)
+
+def callback_update(bot, user_id: int, data: str, chat_id: int = None, message_id: int = None):
+    chat_id = chat_id or user_id
+    message = {
+        "message_id": message_id or next(_message_ids),
+        "date": int(time.time()),
+        "chat": chat_dict(chat_id),
+        "from": BOT_USER,
+        "text": "👥 Networking Links",
+    }
+    callback = {
+        "id": str(next(_update_ids)),
+        "from": user_dict(user_id),
+        "chat_instance": str(chat_id),
+        "message": message,
+        "data": data,
+    }
+    return Update.de_json({"update_id": next(_update_ids), "callback_query": callback}, bot)
@@ -0,0 +1,398 @@
+"""Replay a recorded update trace through the real handlers in bot.py.
+
+    TRACE_PATH=trace.jsonl.gz python bot.py        # record (see update_trace.py)
+    python bench/replay.py trace.jsonl.gz --speed 0 --profile cprofile
+    python bench/replay.py trace.jsonl.gz.worker0 trace.jsonl.gz.worker1 --speed 1
+
+Telegram is replaced by the in-process fake Bot API and storage by the in-memory
+backend (or a copy of a SQLite database with --sqlite), each with configurable
+latency. --speed 1 keeps the recorded spacing between updates, 2 plays twice as
+fast and 0 sends them as fast as they are taken. Several trace files (one per
+worker) are merged by arrival time.
+
+The report gives replayed latency per update next to the recorded one, and per
+handler the number of calls, errors and latency percentiles. With --profile,
+updates are handled one at a time so time can be attributed to the handler that
+ran: cprofile writes <handler>.prof files (open with pstats or snakeviz) and prints
+the top functions, sample writes <handler>.folded stacks from a wall-clock
+sampler for flame graph tools. Background work such as chain edits that runs while a
+handler awaits is counted towards that handler. Results are written as JSON; pass
+--compare with an earlier result file to print the change.
+
+The fake Bot API numbers messages itself, so taps in the trace name chain messages
+the replay never sent. Each group /chain waits for the updates before it and is
+replayed to completion before the next one, and taps on the chain it replaced live are pointed at the one it sent (see
+ChainIds), so chain taps run the same path they did when recorded.
+"""
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import shutil
+import pstats
+import asyncio
+import argparse
+import cProfile
+import tempfile
+import threading
+import collections
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("OUTBOUND_RATE_LIMIT", "0")
+# Replays must not record themselves
+os.environ.pop("TRACE_PATH", None)
+
+from telegram import Update
+import bot
+import storage
+import chain_editor
+import update_trace
+from storage.memory import MemoryBackend
+from bench.fakes import FakeBotRequest
+from bench.event_load import percentile
+
+# Records are written once handled, so a trace file is only roughly in arrival order;
+# this many are held back to put them in order (the recorder tracks as many in flight)
+REORDER_WINDOW = 10000
+
+def by_arrival(records, window: int = REORDER_WINDOW):
+    heap = []
+    for count, record in enumerate(records):
+        heapq.heappush(heap, (record['ts'], count, record))
+        if len(heap) > window:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+def read_traces(paths: list, limit: int = None):
+    records = heapq.merge(*(by_arrival(update_trace.read_trace(path)) for path in paths), key=lambda record: record['ts'])
+    for count, record in enumerate(records):
+        if limit is not None and count >= limit:
+            return
+        yield record
+
+def latency_summary(seconds: list):
+    return {
+        "p50": round(percentile(seconds, 50) * 1000, 2),
+        "p95": round(percentile(seconds, 95) * 1000, 2),
+        "p99": round(percentile(seconds, 99) * 1000, 2),
+    }
+
+def is_chain_command(update: dict):
+    message = update.get('message') or {}
+    command = (message.get('text') or '').split(maxsplit=1)[:1]
+    return (
+        bool(command) and command[0].split('@')[0] == '/chain'
+        and message['chat']['type'] in ('group', 'supergroup')
+    )
+
+class ChainIds:
+    """Matches chain message ids in a trace with the ids of the chains the replay sent.
+
+    After a replayed /chain, the next chain id tapped in that chat that is newer than
+    any matched before is taken to be the chain that /chain sent live. Older ids stay
+    unmatched and get the stale-chain answer, as they did when recorded.
+    """
+
+    def __init__(self):
+        self.rewritten = 0
+        # chat_id -> replayed chain id not matched to a recorded one yet
+        self._sent = {}
+        # chat_id -> newest recorded chain id matched
+        self._latest = {}
+        # (chat_id, recorded chain id) -> replayed chain id
+        self._ids = {}
+
+    def chain_sent(self, chat_id: int, message_id: int):
+        self._sent[chat_id] = message_id
+
+    def rewrite(self, update: dict):
+        """Point a recorded chain tap at the replayed chain, in place"""
+        query = update.get('callback_query') or {}
+        message = query.get('message')
+        if not message or not query.get('data') or message['chat']['type'] not in ('group', 'supergroup'):
+            return
+        chat_id = message['chat']['id']
+        action, chain_id, argument = bot.parse_chain_callback(query['data'], message['message_id'])
+        key = (chat_id, chain_id)
+        if key not in self._ids and chat_id in self._sent and chain_id > self._latest.get(chat_id, 0):
+            self._ids[key] = self._sent.pop(chat_id)
+            self._latest[chat_id] = chain_id
+        replayed = self._ids.get(key)
+        if replayed is None:
+            return
+        if message['message_id'] == chain_id:
+            message['message_id'] = replayed
+        # Buttons from before chain ids were added carry none
+        if query['data'] != action:
+            query['data'] = f"{action}:{replayed}" + (f":{argument}" if argument else "")
+        self.rewritten += 1
+
+# ------------- Per-handler timing and profiling -------------
+class HandlerStats:
+    """Wraps every handler callback to time it; subclasses add a profiler"""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def install(self, app):
+        for handlers in app.handlers.values():
+            for handler in handlers:
+                handler.callback = self.wrap(handler.callback)
+
+    def wrap(self, callback):
+        name = getattr(callback, '__name__', repr(callback))
+
+        async def timed(update, context):
+            start = time.perf_counter()
+            self.begin(name)
+            try:
+                return await callback(update, context)
+            except Exception:
+                self.errors[name] += 1
+                raise
+            finally:
+                self.end(name)
+                self.latencies[name].append(time.perf_counter() - start)
+
+        timed.__name__ = name
+        return timed
+
+    def begin(self, name: str):
+        pass
+
+    def end(self, name: str):
+        pass
+
+    def report(self):
+        return {
+            name: {"calls": len(seconds), "errors": self.errors[name], "latency_ms": latency_summary(seconds)}
+            for name, seconds in sorted(self.latencies.items())
+        }
+
+    def save(self, directory: str):
+        return []
+
+class CProfileStats(HandlerStats):
+    def __init__(self):
+        super().__init__()
+        self.profiles = {}
+
+    def begin(self, name: str):
+        self.profiles.setdefault(name, cProfile.Profile()).enable()
+
+    def end(self, name: str):
+        self.profiles[name].disable()
+
+    def save(self, directory: str):
+        paths = []
+        for name, profile in self.profiles.items():
+            path = os.path.join(directory, f"{name}.prof")
+            profile.dump_stats(path)
+            paths.append(path)
+            print(f"\n--- {name} (top functions in this repo by cumulative time) ---")
+            # Restricted to the repo's files: time the loop spends waiting on fakes would lead otherwise
+            pstats.Stats(profile).sort_stats("cumulative").print_stats(re.escape(ROOT), 10)
+        return paths
+
+class SamplingStats(HandlerStats):
+    """Samples the event loop thread's stack every interval while a handler runs"""
+
+    def __init__(self, interval: float = 0.005):
+        super().__init__()
+        self.interval = interval
+        self.samples = collections.defaultdict(collections.Counter)
+        self._active = None
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="replay-sampler", daemon=True)
+        self._sampler.start()
+
+    def begin(self, name: str):
+        self._active = name
+
+    def end(self, name: str):
+        self._active = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            name = self._active
+            frame = sys._current_frames().get(self._thread_id)
+            if name is None or frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[name][";".join(reversed(stack))] += 1
+
+    def save(self, directory: str):
+        self._stop.set()
+        self._sampler.join()
+        paths = []
+        for name, stacks in self.samples.items():
+            path = os.path.join(directory, f"{name}.folded")
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            paths.append(path)
+        return paths
+
+PROFILERS = {'none': HandlerStats, 'cprofile': CProfileStats, 'sample': SamplingStats}
+
+# ------------- Replay -------------
+async def replay(records, speed: float, stats: HandlerStats, sequential: bool,
+                 storage_latency: float, api_latency: float, sqlite_path: str = None):
+    if sqlite_path:
+        from storage.sqlite import SQLiteBackend
+        backend = SQLiteBackend(sqlite_path)
+    else:
+        backend = MemoryBackend(latency=storage_latency)
+    storage.set_backend(backend)
+    request = FakeBotRequest(latency=api_latency)
+    app = bot.build_application(token="123456:replay", request=request)
+    stats.install(app)
+    await app.initialize()
+
+    recorded, replayed = [], []
+    # Bounds how many replayed updates are in flight when replaying at full speed
+    window = asyncio.Semaphore(256)
+
+    async def dispatch(update: Update):
+        start = time.perf_counter()
+        try:
+            await app.update_processor.process_update(update, app.process_update(update))
+        finally:
+            replayed.append(time.perf_counter() - start)
+            window.release()
+
+    chain_ids = ChainIds()
+    tasks = set()
+    start = time.perf_counter()
+    first_ts = None
+    try:
+        for record in records:
+            first_ts = record['ts'] if first_ts is None else first_ts
+            if speed > 0:
+                delay = (record['ts'] - first_ts) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            recorded.append(record.get('ms', 0) / 1000)
+            chain_ids.rewrite(record['update'])
+            update = Update.de_json(record['update'], app.bot)
+            await window.acquire()
+            if is_chain_command(record['update']):
+                # Taps that follow need the id of the chain this sends, and the setup
+                # sent before it must be done, as it was live
+                await asyncio.gather(*tasks)
+                chat_id = update.effective_chat.id
+                before = await storage.get_active_chain(str(chat_id))
+                await dispatch(update)
+                after = await storage.get_active_chain(str(chat_id))
+                if after is not None and after != before:
+                    chain_ids.chain_sent(chat_id, after)
+            elif sequential:
+                await dispatch(update)
+            else:
+                task = asyncio.create_task(dispatch(update))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        # Edits and writes still pending after the last update are part of the cost
+        await chain_editor.edits.flush()
+        await storage.close_writes()
+        elapsed = time.perf_counter() - start
+    finally:
+        await app.shutdown()
+
+    round_trips = getattr(backend, 'round_trips', None)
+    return {
+        "updates": len(replayed),
+        "seconds": round(elapsed, 3),
+        "recorded_latency_ms": latency_summary(recorded),
+        "replay_latency_ms": latency_summary(replayed),
+        "storage_round_trips": round_trips,
+        "api_calls": dict(request.calls),
+        "chain_taps_rewritten": chain_ids.rewritten,
+        "handlers": stats.report(),
+    }
+
+def compare(current: dict, previous: dict):
+    lines = []
+    for key in ("p50", "p95", "p99"):
+        old, new = previous["replay_latency_ms"][key], current["replay_latency_ms"][key]
+        lines.append(f"update  {key}: {old:9.2f} -> {new:9.2f} ms")
+    for name, report in current["handlers"].items():
+        before = previous.get("handlers", {}).get(name)
+        if before:
+            for key in ("p50", "p95"):
+                old, new = before["latency_ms"][key], report["latency_ms"][key]
+                lines.append(f"{name} {key}: {old:9.2f} -> {new:9.2f} ms")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("traces", nargs="+", help="Trace files written with TRACE_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace, 0 = as fast as possible")
+    parser.add_argument("--limit", type=int, help="Only replay the first N updates")
+    parser.add_argument("--profile", choices=sorted(PROFILERS), default="none")
+    parser.add_argument("--sample-interval", type=float, default=0.005, help="Seconds between stack samples")
+    parser.add_argument("--storage-latency", type=float, default=0.02, help="Seconds per storage call")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="Seconds per Bot API call")
+    parser.add_argument("--sqlite", help="Replay against a copy of this SQLite database instead of empty storage")
+    parser.add_argument("--output", help="Where to write the JSON result (default bench/results/)")
+    parser.add_argument("--compare", help="Earlier JSON result to compare with")
+    args = parser.parse_args()
+
+    started = time.time()
+    stats = SamplingStats(args.sample_interval) if args.profile == 'sample' else PROFILERS[args.profile]()
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_path = None
+        if args.sqlite:
+            # The replay writes to storage, so it gets its own copy
+            sqlite_path = os.path.join(directory, "replay.db")
+            shutil.copyfile(args.sqlite, sqlite_path)
+        report = asyncio.run(replay(
+            read_traces(args.traces, args.limit), args.speed, stats, sequential=args.profile != 'none',
+            storage_latency=args.storage_latency, api_latency=args.api_latency, sqlite_path=sqlite_path,
+        ))
+
+    result = {
+        "benchmark": "replay",
+        "timestamp": int(started),
+        "params": {
+            "traces": args.traces,
+            "speed": args.speed,
+            "limit": args.limit,
+            "profile": args.profile,
+            "storage": "sqlite" if args.sqlite else "memory",
+            "storage_latency": args.storage_latency,
+            "api_latency": args.api_latency,
+        },
+        **report,
+    }
+    results_dir = os.path.join(ROOT, "bench", "results")
+    if args.profile != 'none':
+        profile_dir = os.path.join(results_dir, f"replay_{int(started)}")
+        os.makedirs(profile_dir, exist_ok=True)
+        result["profiles"] = stats.save(profile_dir)
+
+    output = args.output or os.path.join(results_dir, f"replay_{int(started)}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps(result, indent=2))
+    print(f"Saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(result, json.load(f)))
+
+if __name__ == '__main__':
+    main()
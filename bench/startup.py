@@ -0,0 +1,142 @@
+"""Measure the bot's cold start, each run in a fresh interpreter.
+
+    python bench/startup.py --runs 5
+    python bench/startup.py --storage sqlite --compare bench/results/startup_<timestamp>.json
+
+Every run times three stages: importing bot.py, building the application, and
+getting ready to take updates (Application.initialize plus post_init, which
+creates the storage backend). Bot API calls are answered by the in-process fake.
+The report gives the median and minimum of each stage, the bare interpreter start
+for reference, and the slowest top-level imports from `python -X importtime`.
+Results are written as JSON; pass --compare with an earlier result file to print
+the change.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("import", "build", "ready")
+
+def child():
+    # Runs in the measured interpreter; prints the stage timings as JSON
+    import asyncio
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import bot
+    imported = time.perf_counter()
+    from bench.fakes import FakeBotRequest
+    app = bot.build_application(token="123456:startup", request=FakeBotRequest())
+    built = time.perf_counter()
+
+    async def ready():
+        await app.initialize()
+        await app.post_init(app)
+        done = time.perf_counter()
+        await app.shutdown()
+        return done
+
+    ready_at = asyncio.run(ready())
+    bot.storage.shutdown()
+    print(json.dumps({
+        "import": imported - start,
+        "build": built - imported,
+        "ready": ready_at - built,
+        "total": ready_at - start,
+    }))
+
+def run_child(env: dict):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def interpreter_start(env: dict):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    return time.perf_counter() - start
+
+def slowest_imports(env: dict, top: int):
+    """Top-level packages by cumulative import time (ms) when importing bot"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            # The header line
+            continue
+        # Only what bot.py (or the interpreter) imports directly, i.e. the least indented names
+        depth = len(name) - len(name.lstrip())
+        package = name.strip().split(".")[0]
+        if depth <= 3 and package != "bot":
+            packages[package] = max(packages.get(package, 0), int(cumulative) / 1000)
+    ordered = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return {package: round(ms, 1) for package, ms in ordered[:top]}
+
+def compare(current: dict, previous: dict):
+    lines = []
+    for stage in STAGES + ("total",):
+        old = previous.get("stages_ms", {}).get(stage, {}).get("median")
+        new = current["stages_ms"][stage]["median"]
+        if old is not None:
+            lines.append(f"{stage:7} median: {old:8.1f} -> {new:8.1f} ms")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--storage", default="memory", help="STORAGE_BACKEND for the runs (default memory)")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list")
+    parser.add_argument("--output", help="Where to write the JSON result (default bench/results/)")
+    parser.add_argument("--compare", help="Earlier JSON result to compare with")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    env = dict(os.environ, STORAGE_BACKEND=args.storage, TELEGRAM_BOT_TOKEN="123456:startup")
+    env.setdefault("SQLITE_PATH", os.path.join(ROOT, "bench", "results", "startup.db"))
+    os.makedirs(os.path.join(ROOT, "bench", "results"), exist_ok=True)
+    started = time.time()
+    runs = [run_child(env) for _ in range(args.runs)]
+    interpreter = statistics.median(interpreter_start(env) for _ in range(args.runs))
+
+    result = {
+        "benchmark": "startup",
+        "timestamp": int(started),
+        "params": {"runs": args.runs, "storage": args.storage},
+        "interpreter_ms": round(interpreter * 1000, 1),
+        "stages_ms": {
+            stage: {
+                "median": round(statistics.median(run[stage] for run in runs) * 1000, 1),
+                "min": round(min(run[stage] for run in runs) * 1000, 1),
+            }
+            for stage in STAGES + ("total",)
+        },
+        "slowest_imports_ms": slowest_imports(env, args.top),
+    }
+
+    output = args.output or os.path.join(ROOT, "bench", "results", f"startup_{int(started)}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps(result, indent=2))
+    print(f"Saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(result, json.load(f)))
+
+if __name__ == '__main__':
+    main()
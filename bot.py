@@ -1,27 +1,29 @@
 import os
 import logging
-import json
+import secrets
+import asyncio
+import tempfile
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-import re
+from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, TypeHandler, filters
 
 # Load environment details
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
-# Firebase setup
-import firebase_admin
-from firebase_admin import credentials, db
-
-# Load Firebase credentials from environment variable (recommended for Render)
-service_account_info = json.loads(os.environ["GOOGLE_APPLICATION_CREDENTIALS_JSON"])
-cred = credentials.Certificate(service_account_info)
-# You must set FIREBASE_DATABASE_URL in your environment variables (Railway dashboard)
-db_url = os.getenv("FIREBASE_DATABASE_URL")
-firebase_admin.initialize_app(cred, {
-    'databaseURL': db_url
-})
+# Storage backend is chosen with STORAGE_BACKEND (firebase, sqlite or memory). Importing
+# this module connects to nothing: the backend is created in post_init, and optional
+# subsystems are only imported when they are enabled.
+import storage
+import name_cache
+import chain_editor
+import chain_view
+import metrics
+import outbound
+import workers
+import validation
+from dispatcher import ChatSerializingUpdateProcessor
+from models import Platform, to_key
 
 # Setup logging
 logging.basicConfig(
@@ -29,40 +31,135 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-# ------------- User Data Logic (endpoint for individual users) -------------
-def save_user_links(user_id: str, platform: str, link: str):
-    ref = db.reference(f'users/{user_id}')
-    ref.update({platform: link})
-
-def get_user_links(user_id: str):
-    return db.reference(f'users/{user_id}').get()
-
-# ------------- Group Message Logic (endpoints for group messages) -------------
-def save_group_user(chat_id: str, user_id: str):
-    ref = db.reference(f'groups/{chat_id}')
-    members = ref.get() or []
-    if user_id not in members:
-        members.append(user_id)
-        ref.set(members)
-
-def get_group_users(chat_id: str):
-    return db.reference(f'groups/{chat_id}').get() or []
-
-# Track active chain messages in groups
-def save_active_chain(chat_id: str, message_id: int):
-    # Deactivate previous chain if it exists
-    previous_chain = db.reference(f'active_chains/{chat_id}').get()
-    
-    # Save new active chain
-    db.reference(f'active_chains/{chat_id}').set(message_id)
-    
-    # Return the previous chain id if there was one
-    return previous_chain
+# ------------- Chain Rendering -------------
+CHAIN_HEADER = "👥 Networking Links:\n"
+ARCHIVED_HEADER = "👥 Networking Links *(ARCHIVED)*:\n"
 
-def get_active_chain(chat_id: str):
-    return db.reference(f'active_chains/{chat_id}').get()
+def chain_keyboard(chain_id: int = None, page: int = 0, pages: int = 1):
+    # Buttons carry the chain they belong to ('add_linkedin:<chain_id>'), so taps on an
+    # old chain are recognised without a storage lookup
+    suffix = f":{chain_id}" if chain_id is not None else ""
+    keyboard = [
+        [InlineKeyboardButton("🔗 Add Me (LinkedIn)", callback_data=f'add_linkedin{suffix}')],
+        [InlineKeyboardButton("📸 Add Me (Instagram)", callback_data=f'add_instagram{suffix}')],
+        [InlineKeyboardButton("❌ Remove Me", callback_data=f'remove_me{suffix}')]
+    ]
+    # Long chains are paginated ('page:<chain_id>:<page>')
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️ Previous", callback_data=f'page{suffix}:{page - 1}'))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("Next ▶️", callback_data=f'page{suffix}:{page + 1}'))
+        keyboard.append(navigation)
+    return InlineKeyboardMarkup(keyboard)
+
+def parse_chain_callback(data: str, message_id: int):
+    """Split chain button data into (action, chain_id, argument); old buttons without an id use the message id"""
+    action, _, rest = data.partition(':')
+    chain_id, _, argument = rest.partition(':')
+    if chain_id.isdigit():
+        return action, int(chain_id), argument or None
+    return action, message_id, None
+
+# getChat is not a message, so the outbound queue does not pace it; rebuilding a chain
+# fetches unknown names this many at a time
+NAME_FETCH_CONCURRENCY = int(os.getenv("NAME_FETCH_CONCURRENCY", "4"))
+
+async def fetch_display_names(context: ContextTypes.DEFAULT_TYPE, uids: list):
+    """{uid: display name} from Telegram for uids the name cache misses; failed lookups are left out"""
+    limit = asyncio.Semaphore(NAME_FETCH_CONCURRENCY)
+
+    async def fetch(uid):
+        return (await context.bot.get_chat(uid)).full_name
+
+    async def lookup(uid):
+        async with limit:
+            try:
+                return await name_cache.names.get(uid, fetch)
+            except Exception as e:
+                logging.error(f"Error fetching the name of {uid}: {e}")
+                return None
+
+    names = await asyncio.gather(*(lookup(uid) for uid in uids))
+    return {uid: name for uid, name in zip(uids, names) if name}
+
+async def remember_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Every update carries the sender's profile, so keep their display name warm
+    name_cache.names.record_user(update.effective_user)
+
+async def load_chain_view(context: ContextTypes.DEFAULT_TYPE, chat_id: str):
+    """Cached chain view of the group, built with a fixed number of storage calls on a miss.
+
+    Links come from the copies stored with the contributions (see
+    storage.get_chain_profiles). Names come from the name cache, then from the
+    stored snapshot's lines; only members in neither are looked up on Telegram. A view
+    with names that could not be looked up is used once but neither cached nor saved.
+    """
+    view = chain_view.views.get(chat_id)
+    if view is not None:
+        return view
+
+    group_user_ids = await storage.get_group_users(chat_id)
+    contributions = await storage.get_group_contributions(chat_id)
+    profiles = await storage.get_chain_profiles(group_user_ids, contributions)
+    snapshot = await storage.get_chain_snapshot(chat_id) or {}
+    stored = chain_view.snapshot_names(snapshot)
+    names = {uid: name_cache.names.peek(uid) or stored.get(uid) for uid in group_user_ids}
+    names.update(await fetch_display_names(context, [uid for uid, name in names.items() if not name]))
+
+    view = chain_view.ChainView(chat_id, snapshot_version=snapshot.get('version', 0))
+    for uid in group_user_ids:
+        view.set_member(uid, names[uid] or "User", profiles[uid], Platform.from_firebase(contributions.get(uid)))
+    view.partial = not all(names.values())
+    if not view.partial:
+        chain_view.views.put(chat_id, view)
+    return view
+
+def render_view(view: chain_view.ChainView, header: str = CHAIN_HEADER):
+    """Text of the page the chain message shows; only that page's lines are joined"""
+    if metrics.ENABLED:
+        metrics.observe('linklist_chain_members', len(view), buckets=metrics.SIZE_BUCKETS)
+        metrics.set_gauge('linklist_last_chain_members', len(view))
+    return view.render_page(header)
+
+async def save_chain_snapshot(chat_id: str, message_id: int, view: chain_view.ChainView):
+    """Store the view's lines so the chain can be archived or re-rendered with one read"""
+    # A partial view has placeholder names that must not replace the stored ones
+    if view.revision == view.snapshot_revision or view.partial:
+        return
+    revision = view.revision
+    version = await storage.save_chain_snapshot(
+        chat_id, message_id, view.lines(), view.snapshot_version, [to_key(uid) for uid in view.members()]
+    )
+    if version is None:
+        # Someone else updated the snapshot, so this view is out of date: rebuild it on the next tap
+        logging.warning(f"Stale chain snapshot for {chat_id}, dropping cached view")
+        chain_view.views.discard(chat_id)
+        return
+    view.snapshot_version = version
+    view.snapshot_revision = revision
+
+def schedule_chain_edit(context: ContextTypes.DEFAULT_TYPE, chat_id: str, message_id: int, view: chain_view.ChainView):
+    async def render():
+        text = render_view(view)
+        try:
+            await save_chain_snapshot(chat_id, message_id, view)
+        except Exception as e:
+            logging.error(f"Error saving chain snapshot: {e}")
+        return text, chain_keyboard(message_id, view.page, view.page_count(CHAIN_HEADER))
+
+    chain_editor.edits.request_edit(context.bot, chat_id, message_id, render)
+
+async def update_user_link(user_id: str, platform: str, link: str):
+    chats = await storage.save_user_links(user_id, platform, link)
+    # Keep the member's line current in any chain that is already rendered, here and in
+    # the other worker processes
+    chain_view.views.update_link(user_id, Platform.from_name(platform), link)
+    workers.publish('link', user_id, platform, link, chats)
 
 # ------------- Telegram Handlers -------------
+@metrics.instrument_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check if this is a group chat
     if update.effective_chat.type in ['group', 'supergroup']:
@@ -79,7 +176,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
         
     user_id = str(update.message.from_user.id)
-    user_links = get_user_links(user_id) or {}
+    profile = await storage.get_user_profile(user_id)
     
     # Check if user was redirected from a group chat
     from_group = False
@@ -112,7 +209,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Show different buttons based on what links are already set
     keyboard = []
-    if user_links.get('linkedin'):
+    if profile.linkedin:
         keyboard.append([
             InlineKeyboardButton("✏️ Edit LinkedIn", callback_data='edit_linkedin_btn'),
             InlineKeyboardButton("❌ Remove LinkedIn", callback_data='remove_linkedin_btn')
@@ -120,7 +217,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         keyboard.append([InlineKeyboardButton("➕ Add LinkedIn", callback_data='add_linkedin_btn')])
     
-    if user_links.get('instagram'):
+    if profile.instagram:
         keyboard.append([
             InlineKeyboardButton("✏️ Edit Instagram", callback_data='edit_instagram_btn'),
             InlineKeyboardButton("❌ Remove Instagram", callback_data='remove_instagram_btn')
@@ -137,6 +234,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
 
+@metrics.instrument_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = (
         "🔄 *LinkList Bot Help*\n\n"
@@ -156,7 +254,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/edit_linkedin - Edit your LinkedIn link\n"
         "/edit_instagram - Edit your Instagram link\n"
         "/remove_linkedin - Remove your LinkedIn link\n"
-        "/remove_instagram - Remove your Instagram link"
+        "/remove_instagram - Remove your Instagram link\n"
+        "/export - Get a group's chain as a CSV or vCard file (in the group)"
     )
     
     await update.message.reply_text(
@@ -164,51 +263,50 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
 
+@metrics.instrument_handler
 async def edit_linkedin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Please send your new LinkedIn link:")
     context.user_data['awaiting'] = 'linkedin_edit'
 
+@metrics.instrument_handler
 async def edit_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Please send your new Instagram profile link or just your username (e.g., @username):"
     )
     context.user_data['awaiting'] = 'instagram_edit'
 
+@metrics.instrument_handler
 async def remove_linkedin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
-    links = get_user_links(user_id) or {}
-    if 'linkedin' in links:
-        links.pop('linkedin')
-        save_user_links(user_id, 'linkedin', None)
+    profile = await storage.get_user_profile(user_id)
+    if profile.linkedin:
+        await update_user_link(user_id, 'linkedin', None)
         await update.message.reply_text("✅ LinkedIn link removed.")
     else:
         await update.message.reply_text("No LinkedIn link found.")
 
+@metrics.instrument_handler
 async def remove_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
-    links = get_user_links(user_id) or {}
-    if 'instagram' in links:
-        links.pop('instagram')
-        save_user_links(user_id, 'instagram', None)
+    profile = await storage.get_user_profile(user_id)
+    if profile.instagram:
+        await update_user_link(user_id, 'instagram', None)
         await update.message.reply_text("✅ Instagram link removed.")
     else:
         await update.message.reply_text("No Instagram link found.")
 
+@metrics.instrument_handler
 async def handle_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
     text = update.message.text.strip()
 
-    linkedin_pattern = re.compile(r"linkedin\.com/(in|pub|company)/[\w\-]+", re.IGNORECASE)
-    instagram_pattern = re.compile(r"instagram\.com/([\w\.]+)", re.IGNORECASE)
-    instagram_username_pattern = re.compile(r"^@([\w\.]+)$")
-
-    if context.user_data.get('awaiting') == 'linkedin' and linkedin_pattern.search(text):
-        save_user_links(user_id, 'linkedin', text)
+    if context.user_data.get('awaiting') == 'linkedin' and validation.linkedin_link(text):
+        await update_user_link(user_id, 'linkedin', validation.linkedin_link(text))
         await update.message.reply_text("✅ LinkedIn link saved!")
         
         # Check if the user already has an Instagram link
-        user_links = get_user_links(user_id) or {}
-        if not user_links.get('instagram'):
+        profile = await storage.get_user_profile(user_id)
+        if not profile.instagram:
             await update.message.reply_text(
                 "Would you like to add your Instagram link too?\n"
                 "You can simply send your username as @username",
@@ -223,17 +321,10 @@ async def handle_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.pop('awaiting', None)
 
     elif context.user_data.get('awaiting') == 'instagram':
-        # Check if it's an @username format
-        username_match = instagram_username_pattern.match(text)
-        if username_match:
-            # Convert @username to a proper Instagram link
-            username = username_match.group(1)
-            instagram_link = f"https://instagram.com/{username}"
-            save_user_links(user_id, 'instagram', instagram_link)
-            await update.message.reply_text("✅ Instagram link saved!")
-        elif instagram_pattern.search(text):
-            # It's already a proper Instagram link, so no need for reformatting
-            save_user_links(user_id, 'instagram', text)
+        # Accepts @username (converted to a link) or an Instagram link
+        instagram_link = validation.instagram_link(text)
+        if instagram_link:
+            await update_user_link(user_id, 'instagram', instagram_link)
             await update.message.reply_text("✅ Instagram link saved!")
         else:
             # Invalid format of Instagram
@@ -243,8 +334,8 @@ async def handle_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Check if the user already has a LinkedIn link
-        user_links = get_user_links(user_id) or {}
-        if not user_links.get('linkedin'):
+        profile = await storage.get_user_profile(user_id)
+        if not profile.linkedin:
             await update.message.reply_text(
                 "Would you like to add your LinkedIn link too?",
                 reply_markup=InlineKeyboardMarkup([
@@ -267,26 +358,16 @@ async def handle_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         context.user_data.pop('awaiting', None)
 
-    elif context.user_data.get('awaiting') == 'linkedin_edit' and linkedin_pattern.search(text):
-        save_user_links(user_id, 'linkedin', text)
+    elif context.user_data.get('awaiting') == 'linkedin_edit' and validation.linkedin_link(text):
+        await update_user_link(user_id, 'linkedin', validation.linkedin_link(text))
         await update.message.reply_text("✅ LinkedIn link updated!")
         await show_main_menu(update, context)
         context.user_data.pop('awaiting', None)
 
     elif context.user_data.get('awaiting') == 'instagram_edit':
-        # Check if it's an @username format
-        username_match = instagram_username_pattern.match(text)
-        if username_match:
-            # Convert @username to a proper Instagram link
-            username = username_match.group(1)
-            instagram_link = f"https://instagram.com/{username}"
-            save_user_links(user_id, 'instagram', instagram_link)
-            await update.message.reply_text("✅ Instagram link updated!")
-            await show_main_menu(update, context)
-            context.user_data.pop('awaiting', None)
-        elif instagram_pattern.search(text):
-            # It's already a proper Instagram link
-            save_user_links(user_id, 'instagram', text)
+        instagram_link = validation.instagram_link(text)
+        if instagram_link:
+            await update_user_link(user_id, 'instagram', instagram_link)
             await update.message.reply_text("✅ Instagram link updated!")
             await show_main_menu(update, context)
             context.user_data.pop('awaiting', None)
@@ -303,6 +384,7 @@ async def handle_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Instagram format: @username or instagram.com/username"
         )
 # Initialize the networking chain in the group chat
+@metrics.instrument_handler
 async def start_chain(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check if this is a group chat
     if update.effective_chat.type not in ['group', 'supergroup']:
@@ -314,10 +396,10 @@ async def start_chain(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Get the user who initiated the chain
     user_id = str(update.effective_user.id)
-    user_links = get_user_links(user_id) or {}
+    profile = await storage.get_user_profile(user_id)
     
     # Check if the user has set up any links
-    if not user_links or (not user_links.get('linkedin') and not user_links.get('instagram')):
+    if not profile.platforms:
         # Send detailed instructions to private chat only - no message in group
         user = update.effective_user
         try:
@@ -352,65 +434,69 @@ async def start_chain(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Need help? Type /help or message me privately."
     )
     
-    keyboard = [
-        [InlineKeyboardButton("🔗 Add Me (LinkedIn)", callback_data='add_linkedin')],
-        [InlineKeyboardButton("📸 Add Me (Instagram)", callback_data='add_instagram')],
-        [InlineKeyboardButton("❌ Remove Me", callback_data='remove_me')]
-    ]
-    
-    # Send the new chain message
-    chain_message = await update.message.reply_text(
-        intro_text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode='Markdown'
+    # Send the new chain message, ahead of other queued messages like every chain update
+    chain_message = await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=intro_text,
+        reply_markup=chain_keyboard(),
+        parse_mode='Markdown',
+        reply_to_message_id=update.message.message_id,
+        rate_limit_args=outbound.chain_args(context.bot)
     )
     
     # Get previous active chain message and deactivate it
     chat_id = str(update.effective_chat.id)
-    previous_chain_id = save_active_chain(chat_id, chain_message.message_id)
+    previous_chain_id = await storage.save_active_chain(chat_id, chain_message.message_id)
+
+    # The message id is only known once sent, so tag the buttons with it now
+    try:
+        await context.bot.edit_message_reply_markup(
+            chat_id=chain_message.chat_id,
+            message_id=chain_message.message_id,
+            reply_markup=chain_keyboard(chain_message.message_id),
+            rate_limit_args=outbound.chain_args(context.bot)
+        )
+    except Exception as e:
+        logging.error(f"Error tagging chain buttons: {e}")
     
-    # If there was a previous chain, update it to remove interactive buttons (ARCHIIVE to prevent confusion)
+    # If there was a previous chain, update it to remove interactive buttons (ARCHIIVE to prevent confusion).
+    # This runs in the background so the new chain is not held up by it.
     if previous_chain_id:
-        try:
-            # Get all participants from the current active chain's contributions
-            group_user_ids = get_group_users(chat_id)
-            text = "👥 Networking Links *(ARCHIVED)*:\n"
-            for idx, uid in enumerate(group_user_ids, 1):
-                info = get_user_links(uid)
-                user_contributions = db.reference(f'group_contributions/{chat_id}/{uid}').get() or {}
-                try:
-                    name = (await context.bot.get_chat(uid)).full_name
-                except:
-                    name = "User"
-                entry = f"{idx}. {name}"
-                
-                has_link = False
-                if user_contributions.get('linkedin') and info.get('linkedin'):
-                    entry += f" – [LinkedIn]({info['linkedin']})"
-                    has_link = True
-                
-                if user_contributions.get('instagram') and info.get('instagram'):
-                    if has_link:
-                        entry += f" | [Instagram]({info['instagram']})"
-                    else:
-                        entry += f" – [Instagram]({info['instagram']})"
-                
-                text += entry + "\n"
-            
-            # Update the previous chain message to remove buttons and mark as archived
-            await context.bot.edit_message_text(
-                chat_id=update.effective_chat.id,
-                message_id=previous_chain_id,
-                text=text + "\n\n*A new chain has been started. This one is no longer active.*",
-                parse_mode='Markdown'
-            )
-        except Exception as e:
-            logging.error(f"Error updating previous chain: {e}")
+        # Make sure a pending edit cannot bring the buttons back after archiving
+        chain_editor.edits.discard(chat_id, previous_chain_id)
+        context.application.create_task(archive_chain(context, chat_id, previous_chain_id))
+
+async def archive_chain(context: ContextTypes.DEFAULT_TYPE, chat_id: str, message_id: int):
+    try:
+        # Prefer the cached view, then the stored snapshot (one read); rebuild only for
+        # chains that predate snapshots
+        view = chain_view.views.get(chat_id)
+        snapshot = None if view is not None else await storage.get_chain_snapshot(chat_id)
+        if view is not None:
+            lines = view.lines()
+        elif snapshot:
+            lines = snapshot.get('lines') or []
+        else:
+            lines = (await load_chain_view(context, chat_id)).lines()
+        # Archived chains have no page buttons, so they keep their first page
+        text = chain_view.render_first_page(ARCHIVED_HEADER, lines)
+
+        # Update the previous chain message to remove buttons and mark as archived
+        await context.bot.edit_message_text(
+            chat_id=int(chat_id),
+            message_id=message_id,
+            text=text + "\n\n*A new chain has been started. This one is no longer active.*",
+            parse_mode='Markdown',
+            rate_limit_args=outbound.chain_args(context.bot)
+        )
+    except Exception as e:
+        logging.error(f"Error updating previous chain: {e}")
 
+@metrics.instrument_handler
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Helper function to show the main menu in private chat"""
     user_id = str(update.effective_user.id)
-    user_links = get_user_links(user_id) or {}
+    profile = await storage.get_user_profile(user_id)
     
     welcome_text = (
         "👋 *LinkList Bot Menu*\n\n"
@@ -419,7 +505,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Show different buttons based on what links are already set
     keyboard = []
-    if user_links.get('linkedin'):
+    if profile.linkedin:
         keyboard.append([
             InlineKeyboardButton("✏️ Edit LinkedIn", callback_data='edit_linkedin_btn'),
             InlineKeyboardButton("❌ Remove LinkedIn", callback_data='remove_linkedin_btn')
@@ -427,7 +513,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         keyboard.append([InlineKeyboardButton("➕ Add LinkedIn", callback_data='add_linkedin_btn')])
     
-    if user_links.get('instagram'):
+    if profile.instagram:
         keyboard.append([
             InlineKeyboardButton("✏️ Edit Instagram", callback_data='edit_instagram_btn'),
             InlineKeyboardButton("❌ Remove Instagram", callback_data='remove_instagram_btn')
@@ -444,6 +530,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
 
+@metrics.instrument_handler
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -467,10 +554,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
             
         elif query.data == 'remove_linkedin_btn':
-            links = get_user_links(user_id) or {}
-            if 'linkedin' in links:
-                links.pop('linkedin')
-                save_user_links(user_id, 'linkedin', None)
+            profile = await storage.get_user_profile(user_id)
+            if profile.linkedin:
+                await update_user_link(user_id, 'linkedin', None)
                 await query.message.reply_text("✅ LinkedIn link removed.")
             else:
                 await query.message.reply_text("No LinkedIn link found.")
@@ -479,10 +565,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
             
         elif query.data == 'remove_instagram_btn':
-            links = get_user_links(user_id) or {}
-            if 'instagram' in links:
-                links.pop('instagram')
-                save_user_links(user_id, 'instagram', None)
+            profile = await storage.get_user_profile(user_id)
+            if profile.instagram:
+                await update_user_link(user_id, 'instagram', None)
                 await query.message.reply_text("✅ Instagram link removed.")
             else:
                 await query.message.reply_text("No Instagram link found.")
@@ -523,7 +608,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "/edit_linkedin - Edit your LinkedIn link\n"
                 "/edit_instagram - Edit your Instagram link\n"
                 "/remove_linkedin - Remove your LinkedIn link\n"
-                "/remove_instagram - Remove your Instagram link"
+                "/remove_instagram - Remove your Instagram link\n"
+                "/export - Get a group's chain as a CSV or vCard file (in the group)"
             )
             
             await query.message.reply_text(
@@ -535,58 +621,38 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # For group chats
     chat_id = str(query.message.chat.id)
     message_id = query.message.message_id
+    action, chain_id, argument = parse_chain_callback(query.data, message_id)
     
     # Check if this is the active chain message, redirect to lowest message (most recent)
-    active_chain_id = get_active_chain(chat_id)
-    if active_chain_id != message_id:
+    active_chain_id = await storage.get_active_chain(chat_id)
+    if active_chain_id != chain_id:
         await query.message.reply_text(
             "⚠️ This chain is no longer active. Please use the most recent chain message.",
             reply_to_message_id=message_id
         )
         return
     
-    if query.data == 'remove_me':
+    if action == 'page':
+        # Page buttons only change what this message shows
+        view = await load_chain_view(context, chat_id)
+        view.show_page(int(argument or 0), CHAIN_HEADER)
+        schedule_chain_edit(context, chat_id, message_id, view)
+        return
+
+    if action == 'remove_me':
         # Remove user from group in realtime DB
-        members = get_group_users(chat_id)
-        if user_id in members:
-            members.remove(user_id)
-            db.reference(f'groups/{chat_id}').set(members)
+        await storage.remove_group_user(chat_id, user_id)
         
         # Remove user contributions in this group
-        db.reference(f'group_contributions/{chat_id}/{user_id}').delete()
+        await storage.delete_user_contributions(chat_id, user_id)
         
         # Update chain message
-        group_user_ids = get_group_users(chat_id)
-        text = "👥 Networking Links:\n"
-        for idx, uid in enumerate(group_user_ids, 1):
-            info = get_user_links(uid)
-            user_contributions = db.reference(f'group_contributions/{chat_id}/{uid}').get() or {}
-            name = (await context.bot.get_chat(uid)).full_name
-            entry = f"{idx}. {name}"
-            
-            has_link = False
-            if user_contributions.get('linkedin') and info.get('linkedin'):
-                entry += f" – [LinkedIn]({info['linkedin']})"
-                has_link = True
-            
-            if user_contributions.get('instagram') and info.get('instagram'):
-                if has_link:
-                    entry += f" | [Instagram]({info['instagram']})"
-                else:
-                    entry += f" – [Instagram]({info['instagram']})"
-            
-            text += entry + "\n"
-            
-        keyboard = [
-            [InlineKeyboardButton("🔗 Add Me (LinkedIn)", callback_data='add_linkedin')],
-            [InlineKeyboardButton("📸 Add Me (Instagram)", callback_data='add_instagram')],
-            [InlineKeyboardButton("❌ Remove Me", callback_data='remove_me')]
-        ]
-        await query.message.edit_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
-        )
+        view = await load_chain_view(context, chat_id)
+        page = view.page_of(user_id, CHAIN_HEADER)
+        view.remove(user_id)
+        if page is not None:
+            view.show_page(page, CHAIN_HEADER)
+        schedule_chain_edit(context, chat_id, message_id, view)
         
         # Send confirmation to the user's private chat instead of the group (prevent spamming)
         try:
@@ -599,13 +665,13 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         return
 
-    links = get_user_links(user_id)
+    profile = await storage.get_user_profile(user_id)
     platform = None
     
     # Determine which platform the user clicked
-    if query.data == 'add_linkedin':
-        platform = 'linkedin'
-        if not links or not links.get(platform):
+    if action == 'add_linkedin':
+        platform = Platform.LINKEDIN
+        if not profile.link(platform):
             # Guide the user to set up their link first, but in private chat
             try:
                 await context.bot.send_message(
@@ -623,9 +689,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     "❗ You need to set up your LinkedIn link first. Please start a private chat with me."
                 )
             return
-    elif query.data == 'add_instagram':
-        platform = 'instagram'
-        if not links or not links.get(platform):
+    elif action == 'add_instagram':
+        platform = Platform.INSTAGRAM
+        if not profile.link(platform):
             # Guide the user to set up their link first, but in private chat
             try:
                 await context.bot.send_message(
@@ -645,51 +711,182 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
     
     # Track user contributions in the group
-    ref = db.reference(f'group_contributions/{chat_id}/{user_id}')
-    contributions = ref.get() or {}
-    contributions[platform] = True
-    ref.set(contributions)
+    await storage.add_user_contribution(chat_id, user_id, platform.key, profile.link(platform))
     
     # Save user to group if not already present
-    save_group_user(chat_id, user_id)
-    group_user_ids = get_group_users(chat_id)
-
-    # Compile new message
-    text = "👥 Networking Links:\n"
-    for idx, uid in enumerate(group_user_ids, 1):
-        info = get_user_links(uid)
-        user_contributions = db.reference(f'group_contributions/{chat_id}/{uid}').get() or {}
-        name = (await context.bot.get_chat(uid)).full_name
-        entry = f"{idx}. {name}"
-        
-        has_link = False
-        if user_contributions.get('linkedin') and info.get('linkedin'):
-            entry += f" – [LinkedIn]({info['linkedin']})"
-            has_link = True
-        
-        if user_contributions.get('instagram') and info.get('instagram'):
-            if has_link:
-                entry += f" | [Instagram]({info['instagram']})"
-            else:
-                entry += f" – [Instagram]({info['instagram']})"
-        
-        text += entry + "\n"
+    await storage.save_group_user(chat_id, user_id)
+
+    # Patch only this member's line, then re-render the page that holds it (edits from a
+    # burst of taps are merged into one)
+    view = await load_chain_view(context, chat_id)
+    view.add_contribution(user_id, user.full_name, profile, platform)
+    view.show_page(view.page_of(user_id, CHAIN_HEADER), CHAIN_HEADER)
+    schedule_chain_edit(context, chat_id, message_id, view)
+
+# ------------- Attendee import -------------
+# Telegram user ids allowed to bulk-import attendees' links
+ADMIN_USER_IDS = {uid.strip() for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
+@metrics.instrument_handler
+async def import_attendees(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Organizers send a CSV of telegram_user_id,linkedin,instagram with the caption /import"""
+    if str(update.effective_user.id) not in ADMIN_USER_IDS:
+        await update.message.reply_text("⛔ Only the bot's admins can import attendees.")
+        return
+    document = update.message.document
+    if document is None:
+        await update.message.reply_text(
+            "Send the attendee list as a CSV file with the caption /import.\n\n"
+            "Columns: telegram_user_id,linkedin,instagram (empty cells are skipped)"
+        )
+        return
 
-    keyboard = [
-        [InlineKeyboardButton("🔗 Add Me (LinkedIn)", callback_data='add_linkedin')],
-        [InlineKeyboardButton("📸 Add Me (Instagram)", callback_data='add_instagram')],
-        [InlineKeyboardButton("❌ Remove Me", callback_data='remove_me')]
-    ]
-    await query.message.edit_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode='Markdown'
-    )
+    import attendee_import
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "attendees.csv")
+        errors_path = os.path.join(directory, "import_errors.csv")
+        await (await document.get_file()).download_to_drive(path)
+        with open(errors_path, "w", newline='') as errors_file:
+            errors = attendee_import.ErrorLog(errors_file)
+            try:
+                # Other workers' profile caches and chains learn about each written batch
+                report = await attendee_import.import_file(
+                    path, on_error=errors, on_saved=lambda links: workers.publish('links', links)
+                )
+            except (ValueError, UnicodeDecodeError) as e:
+                await update.message.reply_text(f"❗ Could not read the file: {e}")
+                return
+        # Chains rendered before the import may show old links
+        chain_view.views.clear()
+
+        text = f"✅ Imported {report}"
+        if errors.shown:
+            text += "\n\n" + "\n".join(errors.shown)
+        await update.message.reply_text(text)
+        if report.failed > len(errors.shown):
+            with open(errors_path, "rb") as f:
+                await update.message.reply_document(f, filename="import_errors.csv")
+
+# ------------- Chain export -------------
+@metrics.instrument_handler
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [csv|vcf] sends the group's chain back as a file"""
+    if update.effective_chat.type not in ['group', 'supergroup']:
+        await update.message.reply_text("❗ This command only works in group chats.")
+        return
+    import chain_export
+    fmt = context.args[0].lower() if context.args else 'csv'
+    fmt = 'vcf' if fmt == 'vcard' else fmt
+    if fmt not in chain_export.FORMATS:
+        await update.message.reply_text("Usage: /export csv or /export vcf")
+        return
 
-# ------------- Main -------------
-if __name__ == '__main__':
-    app = ApplicationBuilder().token(TOKEN).build()
+    chat_id = str(update.effective_chat.id)
+    # Names the bot already knows; the rest come from the chain snapshot, never member by member
+    view = chain_view.views.get(chat_id)
+    def names(uid):
+        return (view.name_of(uid) if view is not None else None) or name_cache.names.peek(uid)
+
+    _, extension, _ = chain_export.FORMATS[fmt]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"chain.{extension}")
+        with open(path, "w", newline='', encoding='utf-8') as f:
+            exported = await chain_export.export_chain(chat_id, f, fmt, names)
+        if not exported:
+            await update.message.reply_text("No one has joined the chain yet.")
+            return
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                f, filename=f"networking_chain.{extension}", caption=f"👥 {exported} member{'s' if exported != 1 else ''}"
+            )
 
+# ------------- Main -------------
+# Polling is the default; set BOT_MODE=webhook (with WEBHOOK_URL) to receive updates over HTTPS
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Updates for different chats run in parallel; updates within one chat (or one user's
+# private chat) are still handled one at a time
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+# Lets tests and benchmarks point the bot at a local fake Bot API
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
+# With more than one worker, a front process fetches updates and shards them across
+# worker processes by chat
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+async def post_init(app):
+    await storage.open_backend()
+    # Stale chain taps are then rejected without touching storage
+    loaded = await storage.load_active_chains()
+    logging.info(f"Loaded {loaded} active chains")
+    if await storage.start_listeners():
+        logging.info("Profile cache is following the storage change stream")
+    if os.getenv("MAINTENANCE", "1") == "1":
+        if app.job_queue is None:
+            logging.warning("Maintenance is enabled but the job queue is not installed (python-telegram-bot[job-queue])")
+        else:
+            import maintenance
+            maintenance.schedule(app.job_queue)
+    if metrics.ENABLED:
+        update_processor = app.update_processor
+        metrics.register_collector(lambda: {
+            'linklist_storage_queue_depth': storage.stats()['queue_depth'],
+            'linklist_write_behind_pending_members': storage.write_behind_stats()['pending_members'],
+            'linklist_update_locked_chats': update_processor.stats()['locked_keys'],
+        })
+        metrics.register_collector(lambda: {
+            f'linklist_name_cache_{key}': value for key, value in name_cache.names.stats().items()
+        })
+        metrics.register_collector(lambda: {
+            f'linklist_chain_edits_{key}': value for key, value in chain_editor.edits.stats().items()
+        })
+        metrics.register_collector(lambda: {
+            f'linklist_chain_views_{key}': value for key, value in chain_view.views.stats().items()
+        })
+        rate_limiter = app.bot.rate_limiter
+        if rate_limiter is not None:
+            metrics.register_collector(lambda: {
+                f'linklist_outbound_{key}': value for key, value in rate_limiter.stats().items()
+            })
+        metrics.register_collector(lambda: {
+            f'linklist_profile_cache_{subtree}_{key}': value
+            for subtree, entry in storage.cache_stats().items() if isinstance(entry, dict)
+            for key, value in entry.items()
+        })
+        await metrics.start_server()
+
+async def post_shutdown(app):
+    # Chain changes still waiting in the write-behind buffer must reach storage
+    await storage.close_writes()
+    if os.getenv("TRACE_PATH"):
+        import update_trace
+        update_trace.close()
+
+def build_application(token: str = None, request=None, fetch_updates: bool = True):
+    builder = (
+        ApplicationBuilder()
+        .token(token or TOKEN)
+        .concurrent_updates(ChatSerializingUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    if os.getenv("OUTBOUND_RATE_LIMIT", "1") == "1":
+        builder = builder.rate_limiter(outbound.create_rate_limiter())
+    if os.getenv("PERSISTENCE", "storage").lower() != 'none':
+        import persistence
+        builder = builder.persistence(persistence.create_persistence())
+    if request is not None:
+        # Benchmarks and replays answer Bot API calls in-process
+        builder = builder.request(request).updater(None)
+    else:
+        if not fetch_updates:
+            # Workers get their updates from the front process
+            builder = builder.updater(None)
+        if metrics.ENABLED:
+            builder = builder.request(metrics.InstrumentedRequest(connection_pool_size=256))
+    app = builder.build()
+
+    app.add_handler(TypeHandler(Update, remember_user), group=-1)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("chain", start_chain))
@@ -697,8 +894,56 @@ if __name__ == '__main__':
     app.add_handler(CommandHandler("edit_instagram", edit_instagram))
     app.add_handler(CommandHandler("remove_linkedin", remove_linkedin))
     app.add_handler(CommandHandler("remove_instagram", remove_instagram))
+    app.add_handler(CommandHandler("export", export_command))
+    app.add_handler(CommandHandler("import", import_attendees, filters=filters.ChatType.PRIVATE))
+    app.add_handler(MessageHandler(
+        filters.ChatType.PRIVATE & filters.Document.ALL & filters.CaptionRegex(r"^/import\b"), import_attendees
+    ))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_link))
     app.add_handler(CallbackQueryHandler(button_handler))
+    if os.getenv("TRACE_PATH"):
+        # Opt-in: record updates for bench/replay.py
+        import update_trace
+        update_trace.install(app)
+    return app
+
+def webhook_options():
+    webhook_url = os.environ["WEBHOOK_URL"]
+    url_path = os.getenv("WEBHOOK_PATH", "telegram")
+    # Telegram echoes the secret in X-Telegram-Bot-Api-Secret-Token and requests without
+    # it are rejected. Without one anyone could post forged updates (and pass the admin
+    # check of /import), so a random secret is registered when none is configured.
+    secret_token = os.getenv("WEBHOOK_SECRET")
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logging.warning("WEBHOOK_SECRET is not set; using a random secret for this run")
+    return dict(
+        listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8443")),
+        url_path=url_path,
+        webhook_url=f"{webhook_url.rstrip('/')}/{url_path}",
+        secret_token=secret_token,
+    )
 
-    print("🤖 Bot is running...")
-    app.run_polling()
\ No newline at end of file
+def run_webhook(app):
+    app.run_webhook(**webhook_options())
+
+if __name__ == '__main__':
+    if WORKERS > 1:
+        print(f"🤖 Bot is running ({BOT_MODE}, {WORKERS} workers)...")
+        workers.run(
+            WORKERS, TOKEN, BOT_MODE,
+            webhook_options() if BOT_MODE == 'webhook' else None,
+            TELEGRAM_API_BASE_URL,
+        )
+    else:
+        # Storage is connected in post_init, so a misconfigured backend still fails before
+        # the first update is fetched
+        app = build_application()
+
+        print(f"🤖 Bot is running ({BOT_MODE})...")
+        if BOT_MODE == 'webhook':
+            run_webhook(app)
+        else:
+            app.run_polling()
+        storage.shutdown()
@@ -0,0 +1,131 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from telegram.error import BadRequest, RetryAfter
+import outbound
+
+class _ChainState:
+    __slots__ = ('render', 'reply_markup', 'dirty', 'task', 'last_text', 'last_edit_at')
+
+    def __init__(self):
+        self.render = None
+        self.reply_markup = None
+        self.dirty = False
+        self.task = None
+        self.last_text = None
+        self.last_edit_at = 0.0
+
+class ChainEditScheduler:
+    """Coalesces chain message edits so each chain is edited at most once per window.
+
+    Taps only mark the chain dirty; a single task per chain renders the latest state
+    when the window allows, skips the edit if the text did not change and backs off
+    when Telegram answers with RetryAfter.
+    """
+
+    def __init__(self, window: float = 1.0, max_chains: int = 1000):
+        self.window = window
+        self.max_chains = max_chains
+        self._chains = OrderedDict()
+        self.requested = 0
+        self.edits = 0
+        self.skipped = 0
+        self.retries = 0
+
+    def request_edit(self, bot, chat_id, message_id: int, render, reply_markup=None):
+        """Schedule an edit of the chain message; render() is awaited for the text, or for
+        (text, reply_markup) when the keyboard depends on what is rendered"""
+        self.requested += 1
+        key = (str(chat_id), message_id)
+        state = self._chains.get(key)
+        if state is None:
+            state = self._chains[key] = _ChainState()
+            self._evict_idle()
+        self._chains.move_to_end(key)
+
+        state.render = render
+        state.reply_markup = reply_markup
+        state.dirty = True
+        if state.task is None:
+            state.task = asyncio.create_task(self._run(bot, key, state))
+        return state.task
+
+    def discard(self, chat_id, message_id: int):
+        """Drop pending edits for a chain message, e.g. before it is archived"""
+        state = self._chains.pop((str(chat_id), message_id), None)
+        if state is not None and state.task is not None:
+            state.task.cancel()
+
+    async def flush(self):
+        tasks = [state.task for state in self._chains.values() if state.task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, bot, key, state: _ChainState):
+        chat_id, message_id = key
+        try:
+            while state.dirty:
+                # Let the burst accumulate until the window since the last edit has passed
+                delay = state.last_edit_at + self.window - time.monotonic()
+                await asyncio.sleep(max(delay, 0))
+
+                state.dirty = False
+                text = await state.render()
+                reply_markup = state.reply_markup
+                if isinstance(text, tuple):
+                    text, reply_markup = text
+                if text == state.last_text:
+                    self.skipped += 1
+                    continue
+
+                try:
+                    await bot.edit_message_text(
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        text=text,
+                        reply_markup=reply_markup,
+                        parse_mode='Markdown',
+                        rate_limit_args=outbound.chain_args(bot)
+                    )
+                except RetryAfter as e:
+                    self.retries += 1
+                    logging.warning(f"Chain edit in {chat_id} throttled, retrying in {e.retry_after}s")
+                    state.dirty = True
+                    state.last_edit_at = time.monotonic() + float(e.retry_after) - self.window
+                    continue
+                except BadRequest as e:
+                    if "not modified" not in str(e).lower():
+                        raise
+                    self.skipped += 1
+                else:
+                    self.edits += 1
+                state.last_text = text
+                state.last_edit_at = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error updating chain message: {e}")
+        finally:
+            state.task = None
+
+    def _evict_idle(self):
+        if len(self._chains) <= self.max_chains:
+            return
+        for key in list(self._chains):
+            if len(self._chains) <= self.max_chains:
+                break
+            if self._chains[key].task is None:
+                del self._chains[key]
+
+    def stats(self):
+        return {
+            'chains': len(self._chains),
+            'pending': sum(1 for state in self._chains.values() if state.task is not None),
+            'requested': self.requested,
+            'edits': self.edits,
+            'skipped': self.skipped,
+            'retries': self.retries,
+        }
+
+edits = ChainEditScheduler(window=float(os.getenv("CHAIN_EDIT_WINDOW", "1.0")))
@@ -0,0 +1,153 @@
+"""Export a group's chain as CSV or a multi-contact vCard file.
+
+    python chain_export.py -1001234567890 --format vcf --output chain.vcf
+
+Members come in join order from groups/{chat_id}, each with the links they added to
+the chain, copied into group_contributions/ when they added them. Only members whose
+contributions predate those copies need their users/ profile, read EXPORT_BATCH_SIZE
+members at a time with one bulk read. The file is produced by generators that write
+each batch as soon as it is formatted, so only the member ids, their contributions and
+one batch of rows are in memory, however long the chain is. Names not given by the
+caller are taken from the stored chain snapshot, read once and only if needed.
+"""
+import os
+import io
+import csv
+import sys
+import asyncio
+import argparse
+from dotenv import load_dotenv
+from models import PLATFORMS, Platform
+import chain_view
+import storage
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+class ExportRow:
+    __slots__ = ('position', 'user_id', 'name', 'linkedin', 'instagram')
+
+    def __init__(self, position: int, user_id: str, name: str, linkedin: str, instagram: str):
+        self.position = position
+        self.user_id = user_id
+        self.name = name
+        self.linkedin = linkedin
+        self.instagram = instagram
+
+async def snapshot_names(chat_id: str):
+    """Display names by user id as rendered in the stored chain snapshot (one read)"""
+    return chain_view.snapshot_names(await storage.get_chain_snapshot(chat_id) or {})
+
+async def iter_members(chat_id: str, names=None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield lists of ExportRow in join order, one bulk profile read per list.
+
+    names(user_id) may return a display name (e.g. from the bot's name cache); other
+    members are named from the chain snapshot, or get an empty name if they are not in
+    it. Only links the member added to this chain are given.
+    """
+    user_ids = await storage.get_group_users(chat_id)
+    contributions = await storage.get_group_contributions(chat_id)
+    stored = None
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        profiles = await storage.get_chain_profiles(batch, contributions)
+        rows = []
+        for offset, uid in enumerate(batch):
+            profile, platforms = profiles[uid], Platform.from_firebase(contributions.get(uid))
+            links = [profile.link(platform) if platform in platforms else None for platform in PLATFORMS]
+            name = names(uid) if names else None
+            if not name:
+                if stored is None:
+                    stored = await snapshot_names(chat_id)
+                name = stored.get(uid)
+            rows.append(ExportRow(start + offset + 1, uid, name or "", *links))
+        yield rows
+
+# ------------- Formats -------------
+CSV_HEADER = ('position', 'telegram_user_id', 'name', 'linkedin', 'instagram')
+
+async def csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    async for rows in batches:
+        writer.writerows((row.position, row.user_id, row.name, row.linkedin or "", row.instagram or "") for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _escape(value: str):
+    # vCard text values escape backslashes, commas, semicolons and newlines
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;").replace("\n", "\\n")
+
+def _fold(line: str):
+    # Content lines longer than 75 octets continue on lines starting with a space
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        # Never split a UTF-8 sequence
+        while limit < len(encoded) and (encoded[limit] & 0xC0) == 0x80:
+            limit -= 1
+        parts.append(encoded[:limit].decode())
+        encoded = encoded[limit:]
+    return "\r\n ".join(parts) + "\r\n"
+
+def vcard(row: ExportRow):
+    name = row.name or f"Telegram user {row.user_id}"
+    lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{_escape(name)}", f"N:{_escape(name)};;;;"]
+    if row.linkedin:
+        lines.append(f"URL;TYPE=LinkedIn:{row.linkedin}")
+    if row.instagram:
+        lines.append(f"URL;TYPE=Instagram:{row.instagram}")
+    lines += [f"NOTE:Telegram user id {row.user_id}", "END:VCARD"]
+    return "".join(_fold(line) for line in lines)
+
+async def vcard_chunks(batches):
+    async for rows in batches:
+        yield "".join(vcard(row) for row in rows)
+
+# name: (chunk generator, file extension, MIME type)
+FORMATS = {
+    'csv': (csv_chunks, 'csv', 'text/csv'),
+    'vcf': (vcard_chunks, 'vcf', 'text/vcard'),
+}
+
+async def export_chain(chat_id: str, out, fmt: str = 'csv', names=None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Write the chain to the text file out; returns the number of members exported"""
+    chunks, _, _ = FORMATS[fmt]
+    exported = 0
+
+    async def counted():
+        nonlocal exported
+        async for rows in iter_members(chat_id, names, batch_size):
+            exported += len(rows)
+            yield rows
+
+    async for chunk in chunks(counted()):
+        out.write(chunk)
+    return exported
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a group's networking chain as CSV or vCard")
+    parser.add_argument("chat_id", help="Telegram chat id of the group, e.g. -1001234567890")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--output", help="File to write (default stdout)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Profiles per bulk read")
+    args = parser.parse_args()
+
+    load_dotenv()
+    out = open(args.output, "w", newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        exported = asyncio.run(export_chain(args.chat_id, out, args.format, batch_size=args.batch_size))
+    finally:
+        if args.output:
+            out.close()
+        storage.shutdown()
+    print(f"Exported {exported} members", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import os
+import re
+import bisect
+from collections import OrderedDict
+from models import PLATFORMS, Chain, Platform, UserProfile, to_id
+
+# Telegram rejects messages over 4096 characters; pages stay under this many so the
+# header, page footer and archive note still fit
+PAGE_CHARS = int(os.getenv("CHAIN_PAGE_CHARS", "3500"))
+
+_LABELS = {Platform.LINKEDIN: 'LinkedIn', Platform.INSTAGRAM: 'Instagram'}
+# One "[LinkedIn](url)" of an entry; a link ends where the next one starts or at the end
+_LINK = re.compile(r"\[(" + "|".join(_LABELS.values()) + r")\]\((.*?)\)(?= \| \[|$)")
+
+def format_member_entry(name: str, profile: UserProfile, platforms: Platform):
+    """Member's name followed by the links they added to this chain"""
+    links = [
+        f"[{_LABELS[platform]}]({profile.link(platform)})"
+        for platform in PLATFORMS
+        if platform in platforms and profile.link(platform)
+    ]
+    if not links:
+        return name
+    return f"{name} – {' | '.join(links)}"
+
+def render_lines(header: str, lines: list):
+    if not lines:
+        return header
+    return header + "\n".join(lines) + "\n"
+
+def paginate(header: str, lines: list, page_chars: int = PAGE_CHARS):
+    """Index of the first line of every page, filling each page up to page_chars"""
+    starts = [0]
+    size = len(header)
+    for i, line in enumerate(lines):
+        if size + len(line) + 1 > page_chars and i > starts[-1]:
+            starts.append(i)
+            size = len(header)
+        size += len(line) + 1
+    return starts
+
+def render_page(header: str, lines: list, starts: list, page: int):
+    end = starts[page + 1] if page + 1 < len(starts) else len(lines)
+    text = render_lines(header, lines[starts[page]:end])
+    if len(starts) > 1:
+        text += f"\n_Page {page + 1}/{len(starts)}_"
+    return text
+
+def render_first_page(header: str, lines: list):
+    """The first page only, noting how many members did not fit (used for archived chains)"""
+    starts = paginate(header, lines)
+    if len(starts) == 1:
+        return render_lines(header, lines)
+    return render_lines(header, lines[:starts[1]]) + f"\n_…and {len(lines) - starts[1]} more_"
+
+def _entry(line: str):
+    # The member's text without its "12. " number
+    return line[line.index('. ') + 2:]
+
+def name_from_line(line: str):
+    """Member's name in a rendered line, e.g. one from a stored chain snapshot"""
+    entry = _entry(line)
+    starts = [entry.find(f" – [{label}](") for label in _LABELS.values()]
+    return entry[:min((start for start in starts if start >= 0), default=len(entry))]
+
+def snapshot_names(snapshot: dict):
+    """Display names by user id (as stored, decimal strings) in a stored chain snapshot"""
+    members, lines = snapshot.get('members') or [], snapshot.get('lines') or []
+    # Snapshots written before members were stored cannot be matched to user ids
+    if len(members) != len(lines):
+        return {}
+    return {uid: name_from_line(line) for uid, line in zip(members, lines)}
+
+def _profile_from_line(uid: int, line: str):
+    # The links a rendered line shows; the others are not needed to render it again
+    name = name_from_line(line)
+    labels = {label: platform for platform, label in _LABELS.items()}
+    profile = UserProfile(uid)
+    for label, link in _LINK.findall(_entry(line)[len(name):]):
+        profile = profile.with_link(labels[label], link)
+    return name, profile
+
+class ChainView:
+    """Pre-rendered member lines of one group's chain, patched in place on every tap.
+
+    Only the member that changed is re-formatted; removing a member renumbers the
+    lines after it without touching their links. Chains longer than one message are
+    split into pages and `page` is the one the chain message currently shows.
+    Member order and the platforms each member added are kept in a models.Chain;
+    names and links are only kept in the rendered lines and read back from them when
+    a line has to change. Methods also take the decimal-string ids storage uses.
+    """
+
+    def __init__(self, chat_id: int = 0, snapshot_version: int = 0):
+        self._chain = Chain(to_id(chat_id))
+        self._lines = []
+        # Join order of the next member added, as the view only ever appends
+        self._next_join = 0
+        # revision counts local changes; snapshot_revision is the one last stored,
+        # as snapshot_version in storage
+        self.revision = 0
+        self.snapshot_revision = 0
+        self.snapshot_version = snapshot_version
+        # Set when some names are placeholders, see bot.load_chain_view
+        self.partial = False
+        self.page = 0
+        self._pages = None
+
+    def __len__(self):
+        return len(self._chain)
+
+    def __contains__(self, uid):
+        return to_id(uid) in self._chain
+
+    def members(self):
+        return self._chain.user_ids()
+
+    def lines(self):
+        return list(self._lines)
+
+    def name_of(self, uid):
+        uid = to_id(uid)
+        if uid not in self._chain:
+            return None
+        return name_from_line(self._lines[self._chain.index(uid)])
+
+    def set_member(self, uid, name: str, profile: UserProfile, platforms: Platform):
+        uid = to_id(uid)
+        entry = format_member_entry(name, profile, platforms)
+        if uid in self._chain:
+            position = self._chain.index(uid)
+            self._lines[position] = f"{position + 1}. {entry}"
+        else:
+            self._chain.join(uid, self._next_join)
+            self._next_join += 1
+            self._lines.append(f"{len(self._chain)}. {entry}")
+        self._chain.clear_contributions(uid)
+        self._chain.contribute(uid, platforms)
+        self.revision += 1
+
+    def add_contribution(self, uid, name: str, profile: UserProfile, platform: Platform):
+        uid = to_id(uid)
+        platforms = self._chain.platforms_of(uid) if uid in self._chain else Platform.NONE
+        self.set_member(uid, name, profile, platforms | platform)
+
+    def update_link(self, uid, platform: Platform, link: str):
+        uid = to_id(uid)
+        # Only links the member added to this chain are shown
+        if uid not in self._chain or platform not in self._chain.platforms_of(uid):
+            return
+        name, profile = _profile_from_line(uid, self._lines[self._chain.index(uid)])
+        self.set_member(uid, name, profile.with_link(platform, link), self._chain.platforms_of(uid))
+
+    def remove(self, uid):
+        uid = to_id(uid)
+        if uid not in self._chain:
+            return
+        position = self._chain.index(uid)
+        self._chain.leave(uid)
+        del self._lines[position]
+        # Entries after the removed member keep their text, only their number shifts
+        for i in range(position, len(self._chain)):
+            self._lines[i] = f"{i + 1}. {_entry(self._lines[i])}"
+        self.revision += 1
+
+    def render(self, header: str):
+        return render_lines(header, self._lines)
+
+    def page_starts(self, header: str):
+        # Recomputed from line lengths only, once per revision
+        if self._pages is None or self._pages[0] != (self.revision, header):
+            self._pages = ((self.revision, header), paginate(header, self._lines))
+        return self._pages[1]
+
+    def page_count(self, header: str):
+        return len(self.page_starts(header))
+
+    def page_of(self, uid, header: str):
+        """Page holding the member's line, or None if they are not in the chain"""
+        uid = to_id(uid)
+        if uid not in self._chain:
+            return None
+        return bisect.bisect_right(self.page_starts(header), self._chain.index(uid)) - 1
+
+    def show_page(self, page: int, header: str):
+        self.page = max(0, min(page, self.page_count(header) - 1))
+
+    def render_page(self, header: str, page: int = None):
+        """Only the lines of one page (the shown page by default), with a page footer when paginated"""
+        self.show_page(self.page if page is None else page, header)
+        return render_page(header, self._lines, self.page_starts(header), self.page)
+
+class ChainViews:
+    """LRU of chain views by group chat id"""
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._views = OrderedDict()
+
+    def get(self, chat_id: str):
+        view = self._views.get(chat_id)
+        if view is not None:
+            self._views.move_to_end(chat_id)
+        return view
+
+    def put(self, chat_id: str, view: ChainView):
+        self._views[chat_id] = view
+        self._views.move_to_end(chat_id)
+        while len(self._views) > self.max_size:
+            self._views.popitem(last=False)
+
+    def discard(self, chat_id: str):
+        self._views.pop(chat_id, None)
+
+    def clear(self):
+        self._views.clear()
+
+    def update_link(self, uid, platform: Platform, link: str):
+        """Re-render a member's line in every cached chain after they change a link"""
+        for view in self._views.values():
+            view.update_link(uid, platform, link)
+
+    def stats(self):
+        return {'chains': len(self._views), 'members': sum(len(view) for view in self._views.values())}
+
+views = ChainViews(max_size=int(os.getenv("CHAIN_VIEW_CACHE_SIZE", "1000")))
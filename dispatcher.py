@@ -0,0 +1,88 @@
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+class KeyedLocks:
+    """One asyncio.Lock per key, created on demand and dropped as soon as it is idle.
+
+    Memory is bounded by the number of keys with a running or waiting update.
+    """
+
+    def __init__(self):
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    async def acquire(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_ref(key, entry)
+            raise
+
+    def release(self, key):
+        entry = self._locks[key]
+        entry[0].release()
+        self._release_ref(key, entry)
+
+    def _release_ref(self, key, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+def serialization_key(update: object):
+    """Updates with the same key never run at the same time"""
+    if not isinstance(update, Update):
+        return None
+    chat = update.effective_chat
+    if chat is not None and chat.type != 'private':
+        return f"chat:{chat.id}"
+    # Private chats (and chat-less updates) are serialized per user
+    user = update.effective_user
+    if user is not None:
+        return f"user:{user.id}"
+    return f"chat:{chat.id}" if chat is not None else None
+
+# The base class takes its semaphore before do_process_update, i.e. before the chat
+# lock; it is sized so that it never runs out and updates waiting for a busy chat hold
+# none of the `max_running` slots
+_UNBOUNDED = 2 ** 31 - 1
+
+class ChatSerializingUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates for different chats in parallel but one at a time within a chat.
+
+    An update first waits for its chat's lock, then for one of `max_running` slots.
+    Updates queued behind a busy chat hold no slot while they wait, so a burst in one
+    chain cannot delay other chats.
+    """
+
+    def __init__(self, max_running: int):
+        super().__init__(_UNBOUNDED)
+        self.max_running = max_running
+        self._running = asyncio.BoundedSemaphore(max_running)
+        self._locks = KeyedLocks()
+
+    async def do_process_update(self, update, coroutine):
+        key = serialization_key(update)
+        if key is not None:
+            await self._locks.acquire(key)
+        try:
+            async with self._running:
+                await coroutine
+        finally:
+            if key is not None:
+                self._locks.release(key)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        return {'locked_keys': len(self._locks), 'max_running': self.max_running}
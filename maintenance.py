@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+import storage
+import workers
+import chain_view
+import chain_editor
+
+# Groups whose chain has not changed for CHAIN_TTL_DAYS are deleted from storage
+CHAIN_TTL_DAYS = float(os.getenv("CHAIN_TTL_DAYS", "30"))
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", str(6 * 60 * 60)))
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
+
+async def _last_activity(chat_id: str):
+    """The later of the last tap (snapshot) and the last /chain (chain_activity)"""
+    snapshot = await storage.get_chain_snapshot(chat_id) or {}
+    started_at = await storage.get_chain_activity(chat_id)
+    return max(snapshot.get('updated_at') or 0, started_at or 0)
+
+async def _expire(chat_id: str, cutoff: float):
+    if not workers.owns_chat(chat_id) or storage.has_pending_writes(chat_id):
+        return False
+    if await _last_activity(chat_id) >= cutoff:
+        return False
+    active_chain = await storage.get_active_chain(chat_id)
+    await storage.delete_group(chat_id)
+    chain_view.views.discard(chat_id)
+    if active_chain:
+        chain_editor.edits.discard(chat_id, active_chain)
+    return True
+
+async def expire_chains(ttl: float, batch_size: int):
+    """Delete groups whose chain has had no tap and no /chain for more than ttl seconds.
+
+    Groups from before either was recorded get a chain_activity stamp of now, so they
+    expire ttl after the first pass that finds them. With several workers, each one
+    only expires and stamps the chats it owns, whose views, edits and pending writes
+    it holds.
+    """
+    cutoff = time.time() - ttl
+    expired = 0
+    # Chat ids with an activity time, so the pass over active chains can stamp the rest
+    seen = set()
+    async for records in storage.iter_records('chain_snapshots', batch_size):
+        for chat_id, snapshot in records:
+            seen.add(chat_id)
+            # Only old candidates cost the extra reads of _expire
+            if (snapshot or {}).get('updated_at', cutoff) < cutoff and await _expire(chat_id, cutoff):
+                expired += 1
+    async for records in storage.iter_records('chain_activity', batch_size):
+        for chat_id, started_at in records:
+            seen.add(chat_id)
+            if (started_at or cutoff) < cutoff and await _expire(chat_id, cutoff):
+                expired += 1
+    now = int(time.time())
+    async for records in storage.iter_records('active_chains', batch_size):
+        unstamped = {chat_id: now for chat_id, _ in records if chat_id not in seen and workers.owns_chat(chat_id)}
+        if unstamped:
+            await storage.save_chain_activity(unstamped)
+            logging.info(f"Stamped {len(unstamped)} chains without activity times")
+    return expired
+
+async def remove_orphan_contributions(batch_size: int):
+    """Delete contributions of users who are no longer members of the group"""
+    removed = 0
+    async for records in storage.iter_records('group_contributions', batch_size):
+        for chat_id, contributions in records:
+            if not contributions or not workers.owns_chat(chat_id) or storage.has_pending_writes(chat_id):
+                continue
+            # Contributions were read first, so a member who joins meanwhile is never removed
+            members = set(await storage.get_group_users(chat_id))
+            orphans = [uid for uid in contributions if uid not in members]
+            if orphans:
+                await storage.remove_contributions(chat_id, orphans)
+                chain_view.views.discard(chat_id)
+                removed += len(orphans)
+    return removed
+
+async def run(context=None):
+    """Job queue callback: one full maintenance pass, streamed in batches"""
+    start = time.monotonic()
+    try:
+        expired = await expire_chains(CHAIN_TTL_DAYS * 24 * 60 * 60, MAINTENANCE_BATCH_SIZE)
+        orphans = await remove_orphan_contributions(MAINTENANCE_BATCH_SIZE)
+    except Exception as e:
+        logging.error(f"Error running maintenance: {e}")
+        return
+    logging.info(
+        f"Maintenance expired {expired} chains and removed {orphans} orphaned contributions "
+        f"in {time.monotonic() - start:.1f}s"
+    )
+
+def schedule(job_queue):
+    # The first pass waits a while so it does not compete with startup
+    job_queue.run_repeating(run, interval=MAINTENANCE_INTERVAL, first=min(MAINTENANCE_INTERVAL, 10 * 60), name="maintenance")
+
+if __name__ == '__main__':
+    # One pass from the command line, e.g. from cron when the bot runs without a job queue
+    import asyncio
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run())
+    storage.shutdown()
@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+from telegram.request import HTTPXRequest
+
+# Metrics are only collected when METRICS_PORT is set. Otherwise the decorators return
+# the original functions and no request wrapper is installed, so nothing is added to
+# the hot path.
+METRICS_PORT = os.getenv("METRICS_PORT")
+ENABLED = bool(METRICS_PORT)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (5, 10, 25, 50, 100, 200, 500, 1000)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_collectors = []
+_help = {}
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name: str, amount: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram['counts'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+def register_collector(collect):
+    """collect() is called on every scrape and returns {metric_name: value} gauges"""
+    _collectors.append(collect)
+
+def describe(name: str, text: str):
+    _help[name] = text
+
+# ------------- Instrumentation -------------
+def instrument_handler(handler):
+    """Time a Telegram handler and count its failures"""
+    if not ENABLED:
+        return handler
+
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            inc('linklist_handler_errors_total', handler=name)
+            raise
+        finally:
+            observe('linklist_handler_duration_seconds', time.perf_counter() - start, handler=name)
+
+    return wrapper
+
+def record_storage_call(op: str, elapsed: float, failed: bool):
+    observe('linklist_storage_duration_seconds', elapsed, op=op)
+    if failed:
+        inc('linklist_storage_errors_total', op=op)
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that times every outbound Bot API call and counts 429s"""
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            status, payload = await super().do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+            )
+        except Exception:
+            inc('linklist_bot_api_errors_total', method=api_method)
+            raise
+        finally:
+            observe('linklist_bot_api_duration_seconds', time.perf_counter() - start, method=api_method)
+        if status == 429:
+            inc('linklist_bot_api_flood_limited_total', method=api_method)
+        elif status >= 400:
+            inc('linklist_bot_api_errors_total', method=api_method)
+        return status, payload
+
+# ------------- Prometheus exposition -------------
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def render():
+    """Current metrics in the Prometheus text format"""
+    gauges = {}
+    for collect in _collectors:
+        try:
+            for name, value in collect().items():
+                gauges[(name, ())] = value
+        except Exception as e:
+            logging.error(f"Metrics collector failed: {e}")
+
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        gauges.update(_gauges)
+        for (name, labels), value in sorted(_counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(_histograms.items()):
+            header(name, "histogram")
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        # Drain the request headers
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode(errors="replace").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def start_server(port: int = None, host: str = "0.0.0.0"):
+    """Serve /metrics over HTTP on the running event loop"""
+    # Read now rather than at import: worker processes import this module before
+    # they are given their own port
+    port = int(port or os.getenv("METRICS_PORT"))
+    server = await asyncio.start_server(_serve, host, port)
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
+
+describe('linklist_handler_duration_seconds', "Time spent in Telegram handlers")
+describe('linklist_storage_duration_seconds', "Time spent in storage calls, including queueing")
+describe('linklist_bot_api_duration_seconds', "Time spent in outbound Bot API calls")
+describe('linklist_bot_api_flood_limited_total', "Bot API calls rejected with HTTP 429")
+describe('linklist_chain_members', "Members of chains as they are rendered")
@@ -0,0 +1,197 @@
+"""Typed, compact forms of what storage keeps as Firebase dicts.
+
+Storage and the Bot API use decimal-string ids and {platform: link} maps; inside the
+bot ids are ints and contributions are Platform bit flags. The from_firebase()/
+to_firebase() codecs convert at the boundary.
+"""
+import enum
+from array import array
+
+# ------------- Ids -------------
+def to_id(key) -> int:
+    """Firebase key (or Telegram id in any form) as an int"""
+    return int(key)
+
+def to_key(id_: int) -> str:
+    return str(id_)
+
+# ------------- Platforms -------------
+class Platform(enum.IntFlag):
+    NONE = 0
+    LINKEDIN = 1
+    INSTAGRAM = 2
+
+    @classmethod
+    def from_name(cls, name: str):
+        return cls[name.upper()]
+
+    @property
+    def key(self):
+        """Name of a single platform as stored ('linkedin')"""
+        return self.name.lower()
+
+    @classmethod
+    def from_firebase(cls, contributions: dict):
+        """{platform: link} (or True) as flags; unknown platforms are ignored"""
+        flags = cls.NONE
+        for name, added in (contributions or {}).items():
+            if added and name.upper() in cls.__members__:
+                flags |= cls[name.upper()]
+        return flags
+
+    def to_firebase(self):
+        return {platform.key: True for platform in PLATFORMS if platform in self}
+
+# Display order in chain entries
+PLATFORMS = (Platform.LINKEDIN, Platform.INSTAGRAM)
+
+# ------------- Users -------------
+class UserProfile:
+    """A user's links; treated as immutable so chain views can share one instance"""
+
+    __slots__ = ('user_id', 'linkedin', 'instagram')
+
+    def __init__(self, user_id: int, linkedin: str = None, instagram: str = None):
+        self.user_id = user_id
+        self.linkedin = linkedin
+        self.instagram = instagram
+
+    def __eq__(self, other):
+        return isinstance(other, UserProfile) and self.to_tuple() == other.to_tuple()
+
+    def __repr__(self):
+        return f"UserProfile({self.user_id!r}, linkedin={self.linkedin!r}, instagram={self.instagram!r})"
+
+    def to_tuple(self):
+        return (self.user_id, self.linkedin, self.instagram)
+
+    def link(self, platform: Platform):
+        return getattr(self, platform.key)
+
+    def with_link(self, platform: Platform, link: str):
+        profile = UserProfile(self.user_id, self.linkedin, self.instagram)
+        setattr(profile, platform.key, link or None)
+        return profile
+
+    @property
+    def platforms(self):
+        """Platforms the user has a link for"""
+        flags = Platform.NONE
+        for platform in PLATFORMS:
+            if self.link(platform):
+                flags |= platform
+        return flags
+
+    @classmethod
+    def from_firebase(cls, user_id, links: dict):
+        links = links or {}
+        return cls(to_id(user_id), links.get('linkedin') or None, links.get('instagram') or None)
+
+    def to_firebase(self):
+        return {platform.key: self.link(platform) for platform in PLATFORMS if self.link(platform)}
+
+# ------------- Chains -------------
+class Membership:
+    """One member of a chain: when they joined and which links they added to it"""
+
+    __slots__ = ('user_id', 'join_order', 'platforms')
+
+    def __init__(self, user_id: int, join_order: int, platforms: Platform = Platform.NONE):
+        self.user_id = user_id
+        self.join_order = join_order
+        self.platforms = platforms
+
+    def __eq__(self, other):
+        return isinstance(other, Membership) and (
+            (self.user_id, self.join_order, self.platforms) == (other.user_id, other.join_order, other.platforms)
+        )
+
+    def __repr__(self):
+        return f"Membership({self.user_id!r}, {self.join_order!r}, {self.platforms!r})"
+
+class Chain:
+    """A group's members in join order, kept in parallel arrays (about 17 bytes a member).
+
+    Combines groups/{chat_id} ({user_id: join_order}, or the legacy list of ids) and
+    group_contributions/{chat_id} ({user_id: {platform: link}}). Contributions of users
+    who are not members are dropped, as the chain message never shows them.
+    """
+
+    __slots__ = ('chat_id', 'message_id', '_user_ids', '_join_orders', '_platforms')
+
+    def __init__(self, chat_id: int, message_id: int = None):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self._user_ids = array('q')
+        self._join_orders = array('q')
+        self._platforms = bytearray()
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    def __contains__(self, user_id: int):
+        return user_id in self._user_ids
+
+    def __iter__(self):
+        for user_id, join_order, platforms in zip(self._user_ids, self._join_orders, self._platforms):
+            yield Membership(user_id, join_order, Platform(platforms))
+
+    def user_ids(self):
+        return list(self._user_ids)
+
+    def index(self, user_id: int):
+        return self._user_ids.index(user_id)
+
+    def platforms_of(self, user_id: int):
+        return Platform(self._platforms[self.index(user_id)])
+
+    def join(self, user_id: int, join_order: int):
+        """Add a member at their place in join order; joining twice keeps the first place"""
+        if user_id in self._user_ids:
+            return
+        position = len(self._join_orders)
+        while position and self._join_orders[position - 1] > join_order:
+            position -= 1
+        self._user_ids.insert(position, user_id)
+        self._join_orders.insert(position, join_order)
+        self._platforms.insert(position, 0)
+
+    def leave(self, user_id: int):
+        if user_id not in self._user_ids:
+            return
+        position = self.index(user_id)
+        del self._user_ids[position]
+        del self._join_orders[position]
+        del self._platforms[position]
+
+    def contribute(self, user_id: int, platform: Platform):
+        position = self.index(user_id)
+        self._platforms[position] |= platform
+
+    def clear_contributions(self, user_id: int):
+        self._platforms[self.index(user_id)] = 0
+
+    @classmethod
+    def from_firebase(cls, chat_id, members, contributions: dict = None, message_id: int = None):
+        chain = cls(to_id(chat_id), message_id)
+        if isinstance(members, list):
+            members = {uid: order for order, uid in enumerate(members) if uid is not None}
+        for join_order, uid in sorted((order, to_id(uid)) for uid, order in (members or {}).items()):
+            chain._user_ids.append(uid)
+            chain._join_orders.append(join_order)
+            chain._platforms.append(0)
+        for uid, platforms in (contributions or {}).items():
+            uid = to_id(uid)
+            if uid in chain._user_ids:
+                chain.contribute(uid, Platform.from_firebase(platforms))
+        return chain
+
+    def to_firebase(self):
+        """(groups/{chat_id}, group_contributions/{chat_id}) values"""
+        members = {}
+        contributions = {}
+        for member in self:
+            members[to_key(member.user_id)] = member.join_order
+            if member.platforms:
+                contributions[to_key(member.user_id)] = member.platforms.to_firebase()
+        return members, contributions
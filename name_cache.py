@@ -0,0 +1,81 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+class NameCache:
+    """Bounded LRU cache of Telegram display names with a per-entry TTL.
+
+    Names are filled for free from the users seen on incoming updates; a fetch only
+    happens on a miss, and concurrent misses for the same uid share one request.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 6 * 60 * 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, uid, name: str):
+        uid = str(uid)
+        self._entries[uid] = (name, time.monotonic() + self.ttl)
+        self._entries.move_to_end(uid)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def record_user(self, user):
+        if user is not None:
+            self.put(user.id, user.full_name)
+
+    def peek(self, uid):
+        uid = str(uid)
+        entry = self._entries.get(uid)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[uid]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(uid)
+        return name
+
+    async def get(self, uid, fetch):
+        """Return the cached name for uid, awaiting fetch(uid) on a miss"""
+        uid = str(uid)
+        name = self.peek(uid)
+        if name is not None:
+            self.hits += 1
+            return name
+
+        self.misses += 1
+        future = self._inflight.get(uid)
+        if future is None:
+            future = asyncio.ensure_future(fetch(uid))
+            self._inflight[uid] = future
+            future.add_done_callback(lambda f: self._on_fetched(uid, f))
+        return await asyncio.shield(future)
+
+    def _on_fetched(self, uid: str, future):
+        self._inflight.pop(uid, None)
+        if not future.cancelled() and future.exception() is None:
+            self.put(uid, future.result())
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'inflight': len(self._inflight),
+        }
+
+names = NameCache(
+    max_size=int(os.getenv("NAME_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("NAME_CACHE_TTL", str(6 * 60 * 60))),
+)
@@ -0,0 +1,209 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+import metrics
+
+# Priority classes, most urgent first
+CHAIN = 0  # chain messages everyone in the room is watching
+DM = 1     # private messages to a single user
+INFO = 2   # other replies in groups
+PRIORITY_NAMES = {CHAIN: 'chain', DM: 'dm', INFO: 'info'}
+
+# Only message-producing methods count against Telegram's flood limits
+_LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+
+class PriorityBucket:
+    """Token bucket whose waiters are served by priority, then in arrival order"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._waiters)
+
+    def idle(self):
+        return not self._waiters and self._refill() >= self.capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self.tokens
+
+    async def acquire(self, priority: int):
+        if not self._waiters and self._refill() >= 1 and time.monotonic() >= self.paused_until:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._pump()
+        await future
+
+    def pause(self, seconds: float):
+        """Hold every waiter back, e.g. after Telegram answered with RetryAfter"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self._pump()
+
+    def _pump(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        now = time.monotonic()
+        while self._waiters and now >= self.paused_until:
+            if self._waiters[0][2].done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if self.tokens < 1:
+                break
+            self.tokens -= 1
+            heapq.heappop(self._waiters)[2].set_result(None)
+        if self._waiters:
+            delay = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._pump)
+
+    def backlog(self):
+        counts = dict.fromkeys(PRIORITY_NAMES, 0)
+        for priority, _, future in self._waiters:
+            if not future.done():
+                counts[priority] = counts.get(priority, 0) + 1
+        return counts
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """Outbound queue for Bot API calls with priority classes and flood limits.
+
+    Every message-producing request waits for its chat's bucket (groups and private
+    chats have separate limits) and then for the global bucket; whenever a bucket is
+    short, chain edits go first, then DMs, then other group replies. RetryAfter pauses
+    the affected bucket and the request is retried up to max_retries times.
+
+    Chain messages are tagged where they are sent, with rate_limit_args from
+    chain_args(); anything else sent to a private chat is a DM and the rest is
+    informational.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        group_per_minute: float = 20,
+        private_rate: float = 1,
+        private_burst: int = 3,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+    ):
+        self.global_rate = global_rate
+        self.group_per_minute = group_per_minute
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global = None
+        self._chats = OrderedDict()
+        self.sent = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        self.retries = 0
+
+    async def initialize(self):
+        self._global = PriorityBucket(self.global_rate, self.global_rate)
+
+    async def shutdown(self):
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if int(chat_id) < 0:
+                bucket = PriorityBucket(self.group_per_minute / 60, self.group_per_minute)
+            else:
+                bucket = PriorityBucket(self.private_rate, self.private_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > self.max_chats:
+                # Forget chats that are quiet and fully refilled
+                for key in [key for key, value in self._chats.items() if value.idle()]:
+                    del self._chats[key]
+                    if len(self._chats) <= self.max_chats:
+                        break
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    @staticmethod
+    def classify(endpoint: str, data: dict):
+        chat_id = data.get('chat_id')
+        if chat_id is not None and str(chat_id).lstrip('-').isdigit() and int(chat_id) > 0:
+            return DM
+        return INFO
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not endpoint.startswith(_LIMITED_PREFIXES):
+            return await callback(*args, **kwargs)
+
+        priority = (rate_limit_args or {}).get('priority')
+        if priority is None:
+            priority = self.classify(endpoint, data)
+        chat_id = data.get('chat_id')
+        chat_bucket = self._chat_bucket(chat_id) if str(chat_id).lstrip('-').isdigit() else None
+
+        start = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            if chat_bucket is not None:
+                await chat_bucket.acquire(priority)
+            await self._global.acquire(priority)
+            if metrics.ENABLED:
+                metrics.observe('linklist_outbound_wait_seconds', time.monotonic() - start,
+                                priority=PRIORITY_NAMES[priority])
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logging.warning(f"{endpoint} to {chat_id} throttled, retrying in {e.retry_after}s")
+                # Group limits are per chat; anything else is the bot-wide limit
+                if chat_bucket is not None and int(chat_id) < 0:
+                    chat_bucket.pause(float(e.retry_after))
+                else:
+                    self._global.pause(float(e.retry_after))
+                continue
+            self.sent[PRIORITY_NAMES[priority]] += 1
+            return result
+
+    def stats(self):
+        backlog = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        buckets = [self._global] if self._global is not None else []
+        for bucket in buckets + list(self._chats.values()):
+            for priority, count in bucket.backlog().items():
+                backlog[PRIORITY_NAMES[priority]] += count
+        return {
+            'backlog_chain': backlog['chain'],
+            'backlog_dm': backlog['dm'],
+            'backlog_info': backlog['info'],
+            'chats': len(self._chats),
+            'retries': self.retries,
+            **{f'sent_{name}': count for name, count in self.sent.items()},
+        }
+
+def chain_args(bot):
+    """rate_limit_args that send a request as chain traffic; None if bot has no outbound queue"""
+    # The bot refuses rate_limit_args when it has no rate limiter
+    return {'priority': CHAIN} if isinstance(bot.rate_limiter, PriorityRateLimiter) else None
+
+def create_rate_limiter():
+    """Rate limiter configured from the environment"""
+    return PriorityRateLimiter(
+        global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")),
+        group_per_minute=float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20")),
+        private_rate=float(os.getenv("OUTBOUND_PRIVATE_RATE", "1")),
+    )
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from telegram.ext import BasePersistence, PersistenceInput
+import storage
+
+# Which store keeps the setup flow's state: storage (the bot's backend, shared between
+# processes), file (a local JSON file, one process only) or none
+PERSISTENCE = os.getenv("PERSISTENCE", "storage").lower()
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "user_state.json")
+# Seconds between writes of changed state
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+# A prompt left unanswered this long (seconds) is forgotten
+AWAITING_TTL = int(os.getenv("AWAITING_TTL", "86400"))
+
+# user_data keys that are persisted, and the short names they are stored under
+_KEYS = {'awaiting': 'a'}
+
+def encode(user_data: dict, set_at: int):
+    """Compact stored form of a user's state, or None when there is nothing to keep"""
+    state = {short: user_data[key] for key, short in _KEYS.items() if user_data.get(key) is not None}
+    if not state:
+        return None
+    state['t'] = set_at
+    return state
+
+def decode(state: dict):
+    return {key: state[short] for key, short in _KEYS.items() if short in state}
+
+# ------------- Stores -------------
+class FileStateStore:
+    """All states in one JSON file, replaced atomically on every save"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._states = None
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logging.error(f"Ignoring unreadable {self.path}: {e}")
+            return {}
+
+    def _write(self, changes: dict):
+        if self._states is None:
+            self._states = self._read()
+        for user_id, state in changes.items():
+            if state is None:
+                self._states.pop(user_id, None)
+            else:
+                self._states[user_id] = state
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self._states, f, separators=(',', ':'))
+        os.replace(temp_path, self.path)
+
+    async def load(self):
+        self._states = await asyncio.get_running_loop().run_in_executor(None, self._read)
+        return dict(self._states)
+
+    async def save(self, changes: dict):
+        await asyncio.get_running_loop().run_in_executor(None, self._write, changes)
+
+class StorageStateStore:
+    """States in the bot's storage backend (user_state/), visible to every process"""
+
+    async def load(self):
+        await storage.open_backend()
+        states = {}
+        async for records in storage.iter_records('user_state'):
+            states.update((user_id, state) for user_id, state in records if state)
+        return states
+
+    async def save(self, changes: dict):
+        await storage.save_user_states(changes)
+
+# ------------- Persistence -------------
+class UserStatePersistence(BasePersistence):
+    """Keeps the private setup flow's user_data (what the bot is waiting for) across
+    restarts and processes.
+
+    Only the keys in _KEYS are stored, in a compact form stamped with when they were set.
+    PTB offers every user it saw to update_user_data(), so users whose state did not
+    change are skipped and the rest of one update_interval are written in one save().
+    Entries older than ttl are dropped: from storage when loading or saving, and from
+    user_data the next time the user writes.
+
+    Everything is loaded at startup (only users in the middle of the setup flow have
+    state). After reload(), each user's user_data is brought in line with storage on
+    their next update, so a user whose chats moved to another process keeps their prompt.
+    """
+
+    def __init__(self, store, update_interval: float = 5, ttl: int = 86400):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+        self.ttl = ttl
+        # Stored (or about to be stored) state per user
+        self._states = {}
+        self._pending = {}
+        self._expired = set()
+        # Users whose user_data matches _states since the last load
+        self._synced = set()
+        self._lock = asyncio.Lock()
+
+    def _is_expired(self, state: dict):
+        return state['t'] < time.time() - self.ttl
+
+    def _expire(self):
+        for user_id in [uid for uid, state in self._states.items() if self._is_expired(state)]:
+            del self._states[user_id]
+            self._pending[user_id] = None
+            self._expired.add(user_id)
+
+    async def _load(self):
+        states = await self.store.load()
+        self._states = {int(uid): state for uid, state in states.items()}
+        self._synced.clear()
+        self._expire()
+
+    async def _save(self):
+        async with self._lock:
+            # Let the other update_user_data() calls of this run record their changes first
+            await asyncio.sleep(0)
+            changes, self._pending = self._pending, {}
+            if not changes:
+                return
+            try:
+                await self.store.save({str(uid): state for uid, state in changes.items()})
+            except Exception as e:
+                logging.error(f"Failed to save conversation state for {len(changes)} users: {e}")
+                # Keep anything changed since, retry the rest next time
+                self._pending = {**changes, **self._pending}
+
+    async def reload(self):
+        """Write pending state, then read everything again (e.g. after chats moved between workers)"""
+        await self._save()
+        await self._load()
+
+    # ------------- User data -------------
+    async def get_user_data(self):
+        await self._load()
+        if self._pending:
+            await self._save()
+        return {uid: decode(state) for uid, state in self._states.items()}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        if user_id in self._expired:
+            self._expired.discard(user_id)
+            user_data.pop('awaiting', None)
+        if user_id in self._synced:
+            return
+        self._synced.add(user_id)
+        state = self._states.get(user_id)
+        for key in _KEYS:
+            user_data.pop(key, None)
+        if state is not None:
+            user_data.update(decode(state))
+
+    async def update_user_data(self, user_id: int, data: dict):
+        current = self._states.get(user_id)
+        state = encode(data, int(time.time()))
+        if state is None and current is None:
+            return
+        if state is not None and current is not None and decode(state) == decode(current):
+            return
+        if state is None:
+            del self._states[user_id]
+        else:
+            self._states[user_id] = state
+        self._pending[user_id] = state
+        self._expire()
+        await self._save()
+
+    async def drop_user_data(self, user_id: int):
+        if self._states.pop(user_id, None) is not None:
+            self._pending[user_id] = None
+            await self._save()
+
+    async def flush(self):
+        await self._save()
+
+    # ------------- Not persisted -------------
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def get_conversations(self, name: str):
+        return {}
+
+    async def update_conversation(self, name: str, key: tuple, new_state):
+        pass
+
+def create_persistence():
+    """Persistence configured from the environment, or None when PERSISTENCE=none"""
+    if PERSISTENCE == 'none':
+        return None
+    if PERSISTENCE == 'file':
+        store = FileStateStore(PERSISTENCE_PATH)
+    elif PERSISTENCE == 'storage':
+        store = StorageStateStore()
+    else:
+        raise ValueError(f"Unknown PERSISTENCE: {PERSISTENCE}")
+    return UserStatePersistence(store, update_interval=PERSISTENCE_INTERVAL, ttl=AWAITING_TTL)
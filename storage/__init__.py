@@ -0,0 +1,411 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from storage.base import DATASETS, StorageBackend
+from storage.cache import SubtreeCache
+from storage.write_behind import GroupWriteBuffer
+from models import UserProfile
+import metrics
+
+# Backend calls may be blocking network or disk I/O, so they run on a bounded
+# thread pool instead of directly on the event loop.
+MAX_WORKERS = int(os.getenv("STORAGE_MAX_WORKERS", "8"))
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="storage")
+
+# ------------- Backend selection -------------
+_backend = None
+
+def create_backend(name: str = None, **options) -> StorageBackend:
+    """Create a backend by name: firebase (default), sqlite or memory"""
+    name = (name or os.getenv("STORAGE_BACKEND", "firebase")).lower()
+    if name == 'firebase':
+        from storage.firebase import FirebaseBackend
+        return FirebaseBackend(**options)
+    if name == 'sqlite':
+        from storage.sqlite import SQLiteBackend
+        options.setdefault('path', os.getenv("SQLITE_PATH", "linklist.db"))
+        return SQLiteBackend(**options)
+    if name == 'memory':
+        from storage.memory import MemoryBackend
+        return MemoryBackend(**options)
+    raise ValueError(f"Unknown storage backend: {name}")
+
+def get_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+        logging.info(f"Using {_backend.name} storage backend")
+    return _backend
+
+async def open_backend():
+    """Create the backend off the event loop (the Firebase SDK import and login block)"""
+    return await asyncio.get_running_loop().run_in_executor(_executor, get_backend)
+
+def set_backend(backend: StorageBackend):
+    global _backend
+    _backend = backend
+    _users.clear()
+    _contributions.clear()
+
+# ------------- Stats (queue depth and per-call latency) -------------
+_lock = threading.Lock()
+_pending = 0
+_stats = {}
+
+def _record(op: str, elapsed: float, failed: bool):
+    with _lock:
+        entry = _stats.setdefault(op, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed * 1000
+        entry['max_ms'] = max(entry['max_ms'], elapsed * 1000)
+        if failed:
+            entry['errors'] += 1
+
+def stats():
+    """Snapshot of the storage pool: calls waiting or running, and latency per operation"""
+    with _lock:
+        ops = {
+            op: dict(entry, avg_ms=entry['total_ms'] / entry['calls'])
+            for op, entry in _stats.items()
+        }
+        return {'queue_depth': _pending, 'max_workers': MAX_WORKERS, 'ops': ops}
+
+async def _run(op: str, *args):
+    global _pending
+    func = getattr(get_backend(), op)
+    with _lock:
+        _pending += 1
+    start = time.perf_counter()
+    failed = False
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _pending -= 1
+        _record(op, elapsed, failed)
+        if metrics.ENABLED:
+            metrics.record_storage_call(op, elapsed, failed)
+        if elapsed > 1:
+            logging.warning(f"Slow storage call {op}: {elapsed * 1000:.0f} ms")
+
+# ------------- Profile cache -------------
+# users/ and group_contributions/ are read far more often than they change, so both are
+# cached read-through. Writes from this process are applied write-through and reach the
+# other workers as events, which is enough while this bot is the only writer. Following the
+# Firebase change stream is opt-in: a stream opens with the whole subtree, so every worker
+# downloads all of users/ and group_contributions/ on each start and reconnect.
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "50000"))
+PROFILE_CACHE_LISTEN = os.getenv("PROFILE_CACHE_LISTEN", "0") == "1"
+_users = SubtreeCache(PROFILE_CACHE_SIZE)
+_contributions = SubtreeCache(max(1, PROFILE_CACHE_SIZE // 100))
+_listeners = []
+
+def _start_listeners():
+    backend = get_backend()
+    for path, cache in (('users', _users), ('group_contributions', _contributions)):
+        registration = backend.listen(path, cache.apply_event)
+        if registration is None:
+            return False
+        _listeners.append(registration)
+    return True
+
+async def start_listeners():
+    """Subscribe the profile caches to the backend's change stream, if it has one"""
+    if not PROFILE_CACHE_LISTEN or _listeners:
+        return bool(_listeners)
+    return await asyncio.get_running_loop().run_in_executor(_executor, _start_listeners)
+
+def stop_listeners():
+    while _listeners:
+        _listeners.pop().close()
+
+def cache_stats():
+    return {'users': _users.stats(), 'group_contributions': _contributions.stats(), 'listening': bool(_listeners)}
+
+def _note_copies(user_id: str, platform: str, link: str, chats: list):
+    # Chains the user added this platform to hold a copy of the link
+    for chat_id in chats:
+        _contributions.write([chat_id, user_id, platform], link or True)
+
+def note_user_link(user_id: str, platform: str, link: str, chats: list = ()):
+    """Apply a link change another process already wrote; chats are the groups holding copies"""
+    _users.write([user_id, platform], link)
+    _note_copies(user_id, platform, link, chats)
+
+def note_user_links(links: dict):
+    """Apply imported links another process already wrote"""
+    for uid, platforms in links.items():
+        for platform, link in platforms.items():
+            _users.write([uid, platform], link)
+    # Which groups held copies is not known here, so cached contributions are read again
+    _contributions.clear()
+
+def reset_chat_state():
+    """Forget per-chat state (active chains, cached contributions) so it is read again"""
+    _active_chains.clear()
+    _contributions.clear()
+    if _backend is not None:
+        _backend.reset_chat_state()
+
+# ------------- User Data Logic (endpoint for individual users) -------------
+async def save_user_links(user_id: str, platform: str, link: str):
+    """Set a link and its copies in the user's chains; returns the chat ids of those chains"""
+    _writes.update_link(user_id, platform, link)
+    chats = await _run('save_user_links', user_id, platform, link) or []
+    _users.write([user_id, platform], link)
+    _note_copies(user_id, platform, link, chats)
+    return chats
+
+async def save_users_links(links: dict):
+    """Bulk write of {user_id: {platform: link}} in one backend call"""
+    for uid, platforms in links.items():
+        for platform, link in platforms.items():
+            _writes.update_link(uid, platform, link)
+    chats = await _run('save_users_links', links) or []
+    for uid, platforms in links.items():
+        for platform, link in platforms.items():
+            _users.write([uid, platform], link)
+    for chat_id in chats:
+        _contributions.discard(chat_id)
+
+async def get_user_links(user_id: str):
+    hit, value = _users.lookup(user_id)
+    if hit:
+        return value
+    links = await _run('get_user_links', user_id)
+    _users.store(user_id, links, value)
+    return links
+
+async def get_users_links(user_ids: list):
+    links, missing, generation = {}, [], None
+    for uid in user_ids:
+        hit, value = _users.lookup(uid)
+        if hit:
+            links[uid] = value or {}
+        else:
+            missing.append(uid)
+            generation = value if generation is None else generation
+    if missing:
+        fetched = await _run('get_users_links', missing)
+        for uid in missing:
+            links[uid] = fetched.get(uid) or {}
+            _users.store(uid, links[uid] or None, generation)
+    return links
+
+async def get_user_profile(user_id: str) -> UserProfile:
+    return UserProfile.from_firebase(user_id, await get_user_links(user_id))
+
+async def get_user_profiles(user_ids: list):
+    """{user_id: UserProfile}, keyed by the ids as given"""
+    links = await get_users_links(user_ids)
+    return {uid: UserProfile.from_firebase(uid, links[uid]) for uid in user_ids}
+
+async def get_chain_profiles(user_ids: list, contributions: dict):
+    """{user_id: UserProfile} with the links members added to a chain.
+
+    Built from the copies in contributions (see get_group_contributions); only members
+    whose contributions predate the copies (stored as True) have their profile read.
+    """
+    legacy = [uid for uid in user_ids if True in (contributions.get(uid) or {}).values()]
+    profiles = await get_user_profiles(legacy) if legacy else {}
+    return {uid: profiles.get(uid) or UserProfile.from_firebase(uid, contributions.get(uid)) for uid in user_ids}
+
+# ------------- Write-behind for chain taps -------------
+# Joins, leaves and contributions are recorded in memory and reads see them at once;
+# a background task writes each chat's batch with one apply_group_changes() call
+# every WRITE_BEHIND_INTERVAL seconds, or sooner once a chat has WRITE_BEHIND_MAX_PENDING
+# members waiting. Failed batches are put back and retried with backoff.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "1") == "1"
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "100"))
+_writes = GroupWriteBuffer()
+_flusher = None
+_flush_soon = None
+
+def _buffered(chat_id: str):
+    global _flusher, _flush_soon
+    if _flusher is None or _flusher.done():
+        _flush_soon = asyncio.Event()
+        _flusher = asyncio.create_task(_flush_loop())
+    if _writes.pending(chat_id) >= WRITE_BEHIND_MAX_PENDING:
+        _flush_soon.set()
+
+async def _flush_chat(chat_id: str):
+    changes = _writes.take(chat_id)
+    try:
+        await _run('apply_group_changes', chat_id, changes['joins'], changes['leaves'],
+                   changes['contributions'], changes['cleared'])
+    except BaseException:
+        # Every change in a batch is idempotent, so retrying one that landed is harmless
+        _writes.restore(chat_id)
+        raise
+    _writes.done(chat_id)
+
+async def flush_writes():
+    """Write every pending chain change now; returns the number of chats that failed"""
+    results = await asyncio.gather(*(_flush_chat(chat_id) for chat_id in _writes.chats()), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        logging.error(f"Error writing chain changes for {len(errors)} chats: {errors[0]}")
+    return len(errors)
+
+async def _flush_loop():
+    delay = WRITE_BEHIND_INTERVAL
+    while True:
+        try:
+            await asyncio.wait_for(_flush_soon.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        _flush_soon.clear()
+        failed = await flush_writes()
+        delay = min(delay * 2, 30) if failed else WRITE_BEHIND_INTERVAL
+
+async def close_writes(attempts: int = 3):
+    """Stop the background flusher and write everything still pending"""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        await asyncio.gather(_flusher, return_exceptions=True)
+        _flusher = None
+    for attempt in range(attempts):
+        if not await flush_writes() and not len(_writes):
+            return
+        await asyncio.sleep(2 ** attempt)
+
+def has_pending_writes(chat_id: str):
+    return _writes.pending(chat_id) > 0 or chat_id in _writes.in_flight()
+
+def write_behind_stats():
+    return {'pending_members': len(_writes), 'pending_chats': len(_writes.chats())}
+
+# ------------- Group Message Logic (endpoints for group messages) -------------
+async def save_group_user(chat_id: str, user_id: str):
+    if WRITE_BEHIND:
+        _writes.join(chat_id, user_id)
+        _buffered(chat_id)
+    else:
+        await _run('save_group_user', chat_id, user_id)
+
+async def remove_group_user(chat_id: str, user_id: str):
+    if WRITE_BEHIND:
+        _writes.leave(chat_id, user_id)
+        _buffered(chat_id)
+    else:
+        await _run('remove_group_user', chat_id, user_id)
+
+async def get_group_users(chat_id: str):
+    return _writes.overlay_members(chat_id, await _run('get_group_users', chat_id))
+
+async def add_user_contribution(chat_id: str, user_id: str, platform: str, link: str = None):
+    """Record that the user added a platform to the chain, with a copy of their link"""
+    if WRITE_BEHIND:
+        _writes.contribute(chat_id, user_id, platform, link or True)
+        _buffered(chat_id)
+    else:
+        await _run('add_user_contribution', chat_id, user_id, platform, link)
+    _contributions.write([chat_id, user_id, platform], link or True)
+
+async def get_group_contributions(chat_id: str):
+    hit, value = _contributions.lookup(chat_id)
+    if hit:
+        return _writes.overlay_contributions(chat_id, value or {})
+    contributions = await _run('get_group_contributions', chat_id)
+    _contributions.store(chat_id, contributions or None, value)
+    return _writes.overlay_contributions(chat_id, contributions or {})
+
+async def delete_user_contributions(chat_id: str, user_id: str):
+    if WRITE_BEHIND:
+        _writes.clear_contributions(chat_id, user_id)
+        _buffered(chat_id)
+    else:
+        await _run('delete_user_contributions', chat_id, user_id)
+    _contributions.write([chat_id, user_id], None)
+
+# Track active chain messages in groups. Every chain change goes through this process,
+# so an in-process table answers lookups without a round trip.
+_active_chains = {}
+
+async def save_active_chain(chat_id: str, message_id: int):
+    previous_chain = await _run('save_active_chain', chat_id, message_id)
+    _active_chains[chat_id] = message_id
+    return previous_chain
+
+async def get_active_chain(chat_id: str):
+    if chat_id in _active_chains:
+        return _active_chains[chat_id]
+    message_id = await _run('get_active_chain', chat_id)
+    _active_chains[chat_id] = message_id
+    return message_id
+
+def _load_active_chains(batch_size: int):
+    loaded = 0
+    for records in get_backend().iter_records('active_chains', batch_size):
+        _active_chains.update(records)
+        loaded += len(records)
+    return loaded
+
+async def load_active_chains(batch_size: int = 1000):
+    """Fill the active-chain table at startup, streaming the records in batches"""
+    return await asyncio.get_running_loop().run_in_executor(_executor, _load_active_chains, batch_size)
+
+async def get_chain_activity(chat_id: str):
+    """When the group's last /chain was started (unix time), or None"""
+    return await _run('get_chain_activity', chat_id)
+
+async def save_chain_activity(stamps: dict):
+    """Set {chat_id: started_at} for groups at once, e.g. ones from before it was recorded"""
+    await _run('write_records', 'chain_activity', list(stamps.items()))
+
+async def save_chain_snapshot(chat_id: str, message_id: int, lines: list, base_version: int, members: list = None):
+    return await _run('save_chain_snapshot', chat_id, message_id, lines, base_version, members)
+
+async def get_chain_snapshot(chat_id: str):
+    return await _run('get_chain_snapshot', chat_id)
+
+# ------------- Conversation state (see persistence.py) -------------
+async def save_user_states(states: dict):
+    await _run('save_user_states', states)
+
+# ------------- Maintenance -------------
+async def iter_records(dataset: str, batch_size: int = 500):
+    """Stream a data set batch by batch; each page is fetched on the storage pool"""
+    loop = asyncio.get_running_loop()
+    pages = get_backend().iter_records(dataset, batch_size)
+    while True:
+        records = await loop.run_in_executor(_executor, next, pages, None)
+        if records is None:
+            return
+        yield records
+
+async def delete_group(chat_id: str):
+    await _run('delete_group', chat_id)
+    _active_chains.pop(chat_id, None)
+    _contributions.write([chat_id], None)
+
+async def remove_contributions(chat_id: str, user_ids: list):
+    """Delete several members' contributions in one write"""
+    await _run('apply_group_changes', chat_id, {}, [], {}, list(user_ids))
+    for uid in user_ids:
+        _contributions.write([chat_id, uid], None)
+
+def shutdown():
+    stop_listeners()
+    _executor.shutdown(wait=True)
+    if len(_writes) and _backend is not None:
+        # Normally emptied by close_writes(); this is the last chance to keep the changes
+        for chat_id in _writes.chats():
+            changes = _writes.take(chat_id)
+            try:
+                _backend.apply_group_changes(chat_id, **changes)
+                _writes.done(chat_id)
+            except Exception as e:
+                logging.error(f"Lost chain changes for {chat_id}: {e}")
+    if _backend is not None:
+        _backend.close()
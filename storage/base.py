@@ -0,0 +1,136 @@
+# The data sets the bot persists, named after their Firebase paths
+DATASETS = ('users', 'groups', 'group_contributions', 'active_chains', 'chain_activity', 'chain_snapshots', 'user_state')
+
+class StorageBackend:
+    """Synchronous interface every storage engine implements.
+
+    Methods may block; the async API in storage/__init__.py runs them on a thread pool.
+    Records exchanged by iter_records/write_records use the Firebase layout:
+
+    - users: (user_id, {platform: link})
+    - groups: (chat_id, {user_id: join_order})
+    - group_contributions: (chat_id, {user_id: {platform: link}}), a copy of the link the
+      member added to the chain (True in data written before links were copied)
+    - active_chains: (chat_id, message_id)
+    - chain_activity: (chat_id, started_at), when the last /chain was started
+    - chain_snapshots: (chat_id, {version, message_id, lines, members, updated_at}); members are
+      the user ids of the lines, in the same order
+    - user_state: (user_id, {a: awaiting, t: set_at}), see persistence.py
+    """
+
+    name = None
+
+    # ------------- Users -------------
+    def save_user_links(self, user_id: str, platform: str, link: str):
+        """Set one of a user's links, and its copy in every chain they added it to.
+
+        Returns the chat ids whose contributions were updated.
+        """
+        raise NotImplementedError
+
+    def get_user_links(self, user_id: str):
+        raise NotImplementedError
+
+    def get_users_links(self, user_ids: list):
+        return {uid: self.get_user_links(uid) or {} for uid in user_ids}
+
+    def save_users_links(self, links: dict):
+        """Set several users' links at once ({user_id: {platform: link}}); other platforms are kept.
+
+        Returns the chat ids whose contributions were updated, as save_user_links does.
+        """
+        chats = set()
+        for uid, platforms in links.items():
+            for platform, link in platforms.items():
+                chats.update(self.save_user_links(uid, platform, link) or ())
+        return sorted(chats)
+
+    # ------------- Groups -------------
+    def save_group_user(self, chat_id: str, user_id: str):
+        raise NotImplementedError
+
+    def remove_group_user(self, chat_id: str, user_id: str):
+        raise NotImplementedError
+
+    def get_group_users(self, chat_id: str):
+        raise NotImplementedError
+
+    def add_user_contribution(self, chat_id: str, user_id: str, platform: str, link: str = None):
+        raise NotImplementedError
+
+    def get_group_contributions(self, chat_id: str):
+        raise NotImplementedError
+
+    def delete_user_contributions(self, chat_id: str, user_id: str):
+        raise NotImplementedError
+
+    def apply_group_changes(self, chat_id: str, joins: dict, leaves: list, contributions: dict, cleared: list):
+        """Write a batch of chain changes for one group.
+
+        Applied in this order: members in leaves are removed, cleared members lose their
+        contributions, joins ({user_id: join_order}) add members who are not in the group
+        yet, then contributions ({user_id: {platform: link}}) are added.
+        """
+        for uid in leaves:
+            self.remove_group_user(chat_id, uid)
+        for uid in cleared:
+            self.delete_user_contributions(chat_id, uid)
+        for uid in joins:
+            self.save_group_user(chat_id, uid)
+        for uid, platforms in contributions.items():
+            for platform, link in platforms.items():
+                self.add_user_contribution(chat_id, uid, platform, link)
+
+    def delete_group(self, chat_id: str):
+        """Remove everything stored for a group: members, contributions, active chain, activity and snapshot"""
+        raise NotImplementedError
+
+    # ------------- Active chains -------------
+    def save_active_chain(self, chat_id: str, message_id: int):
+        """Set the group's active chain and stamp its chain_activity; returns the previous chain"""
+        raise NotImplementedError
+
+    def get_active_chain(self, chat_id: str):
+        raise NotImplementedError
+
+    def get_chain_activity(self, chat_id: str):
+        raise NotImplementedError
+
+    # ------------- Chain snapshots -------------
+    def save_chain_snapshot(self, chat_id: str, message_id: int, lines: list, base_version: int, members: list = None):
+        """Store the rendered member lines (and their user ids) if the stored version is still base_version.
+
+        Returns the new version, or None when another writer got there first.
+        """
+        raise NotImplementedError
+
+    def get_chain_snapshot(self, chat_id: str):
+        raise NotImplementedError
+
+    # ------------- Conversation state -------------
+    def save_user_states(self, states: dict):
+        """Write several users' conversation state at once; a None state deletes it"""
+        raise NotImplementedError
+
+    # ------------- Bulk access (used by migrations) -------------
+    def iter_records(self, dataset: str, batch_size: int = 500):
+        """Yield lists of (key, value) records for a data set, batch_size at a time"""
+        raise NotImplementedError
+
+    def write_records(self, dataset: str, records: list):
+        raise NotImplementedError
+
+    # ------------- Change streams -------------
+    def listen(self, path: str, callback):
+        """Call callback(event) for every change under path, Firebase-style.
+
+        Returns a registration with close(), or None when the backend cannot stream changes.
+        """
+        return None
+
+    def reset_chat_state(self):
+        """Forget per-chat state kept in this process, for chats that may have moved to another"""
+        pass
+
+    def close(self):
+        pass
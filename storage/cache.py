@@ -0,0 +1,108 @@
+import copy
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+def _set(value, path: list, data):
+    """Return value with data written at path; None deletes, like the Realtime Database"""
+    if not path:
+        return data
+    value = dict(value) if isinstance(value, dict) else {}
+    child = _set(value.get(path[0]), path[1:], data)
+    if child is None:
+        value.pop(path[0], None)
+    else:
+        value[path[0]] = child
+    return value or None
+
+class SubtreeCache:
+    """Bounded LRU copy of the children of one storage path (e.g. users/).
+
+    Values are filled read-through and kept coherent either by write-through from
+    this process or by Firebase-style change events (event_type, path, data) from a
+    listener. Events for children that are not cached are ignored, so listening never
+    grows the cache past max_size.
+    """
+
+    def __init__(self, max_size: int = 50000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every write or event so reads that raced a change are not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key: str):
+        """Return (True, value) on a hit, (False, generation) on a miss"""
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return False, self._generation
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, copy.deepcopy(value)
+
+    def store(self, key: str, value, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = copy.deepcopy(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def write(self, path: list, data, patch: bool = False):
+        """Apply a change at path (relative to the cached root) to the children that are cached.
+
+        A patch writes each of its keys, which may themselves be multi-segment paths.
+        """
+        with self._lock:
+            self._generation += 1
+            if patch:
+                for key, value in (data or {}).items():
+                    self._put(path + [part for part in key.split('/') if part], value)
+            else:
+                self._put(path, data)
+
+    def _put(self, path: list, data):
+        if not path:
+            # A full resync: refresh what is cached, forget nothing else
+            data = data or {}
+            for key in self._entries:
+                self._entries[key] = data.get(key)
+            return
+        key = path[0]
+        if key in self._entries:
+            self._entries[key] = _set(self._entries[key], path[1:], data)
+
+    def apply_event(self, event):
+        """Listener callback: apply a Firebase db.Event (or anything shaped like one)"""
+        path = [part for part in (event.path or '/').split('/') if part]
+        self.write(path, event.data, patch=event.event_type == 'patch')
+
+    def discard(self, key: str):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
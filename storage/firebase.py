@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import firebase_admin
+from firebase_admin import credentials, db
+from storage.base import StorageBackend
+
+def _join_order():
+    return time.time_ns() // 1000
+
+def _members_from_list(members: list):
+    return {uid: idx for idx, uid in enumerate(members) if uid is not None}
+
+class FirebaseBackend(StorageBackend):
+    """Firebase Realtime Database, the original storage of the bot"""
+
+    name = 'firebase'
+
+    def __init__(self, max_workers: int = 16, member_cache_size: int = 1000):
+        if not firebase_admin._apps:
+            # Load Firebase credentials from environment variable (recommended for Render)
+            service_account_info = json.loads(os.environ["GOOGLE_APPLICATION_CREDENTIALS_JSON"])
+            cred = credentials.Certificate(service_account_info)
+            # You must set FIREBASE_DATABASE_URL in your environment variables (Railway dashboard)
+            firebase_admin.initialize_app(cred, {
+                'databaseURL': os.getenv("FIREBASE_DATABASE_URL")
+            })
+        # Multi-path reads fan out on their own pool so a batch never waits behind itself
+        self._batch_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="firebase-batch")
+        self._migrated_groups = set()
+        # Member ids of recently used groups, from reads and this process's own writes,
+        # so flushing joins needs no read of the group first
+        self._members = OrderedDict()
+        self._members_lock = threading.Lock()
+        self._member_cache_size = member_cache_size
+
+    # ------------- User Data Logic (endpoint for individual users) -------------
+    # group_contributions keep a copy of each link a member added to a chain, so a chain
+    # is rendered or exported from one read. user_contributions/{user_id}/{chat_id} lists
+    # the platforms a user added there, so a changed link reaches every copy in the same
+    # multi-path update.
+    def _user_contributions(self, user_id: str):
+        return db.reference(f'user_contributions/{user_id}').get() or {}
+
+    def _link_updates(self, links: dict, contributed: dict):
+        updates, chats = {}, set()
+        for uid, platforms in links.items():
+            for platform, link in platforms.items():
+                updates[f'users/{uid}/{platform}'] = link
+                for chat_id, added in contributed.get(uid, {}).items():
+                    if (added or {}).get(platform):
+                        updates[f'group_contributions/{chat_id}/{uid}/{platform}'] = link or True
+                        chats.add(chat_id)
+        return updates, sorted(chats)
+
+    def save_user_links(self, user_id: str, platform: str, link: str):
+        updates, chats = self._link_updates({user_id: {platform: link}}, {user_id: self._user_contributions(user_id)})
+        db.reference().update(updates)
+        return chats
+
+    def get_user_links(self, user_id: str):
+        return db.reference(f'users/{user_id}').get()
+
+    def save_users_links(self, links: dict):
+        # One user_contributions read per user (max_workers at a time), then one multi-path
+        # update for the whole batch
+        contributed = dict(zip(links, self._batch_executor.map(self._user_contributions, links)))
+        updates, chats = self._link_updates(links, contributed)
+        db.reference().update(updates)
+        return chats
+
+    def get_users_links(self, user_ids: list):
+        # The Realtime Database REST API has no multi-get, so this is one GET per user,
+        # max_workers at a time. Chains are rendered and exported from the links copied
+        # into group_contributions, so only contributions from before those copies come here.
+        results = self._batch_executor.map(self.get_user_links, user_ids)
+        return {uid: links or {} for uid, links in zip(user_ids, results)}
+
+    # ------------- Group Message Logic (endpoints for group messages) -------------
+    # Members are stored as a map of {user_id: join_order} so joins and leaves are single-key
+    # writes. Older data stored a plain list of user ids and is migrated on first read.
+    def _migrate_group(self, chat_id: str):
+        def migrate(current):
+            if isinstance(current, list):
+                return _members_from_list(current)
+            return current
+        members = db.reference(f'groups/{chat_id}').transaction(migrate)
+        self._migrated_groups.add(chat_id)
+        return members
+
+    def _ensure_migrated(self, chat_id: str):
+        # A single-key write into a list-shaped group would mix both layouts, so each
+        # group is checked once per process before its first membership write
+        if chat_id not in self._migrated_groups:
+            self._migrate_group(chat_id)
+
+    # Each chat is handled by one process (see workers.py), so the member ids it has read
+    # or written stay current until reset_chat_state
+    def _known_members(self, chat_id: str):
+        with self._members_lock:
+            members = self._members.get(chat_id)
+            if members is not None:
+                self._members.move_to_end(chat_id)
+                return members
+        members = set(db.reference(f'groups/{chat_id}').get(shallow=True) or {})
+        self._remember_members(chat_id, members)
+        return members
+
+    def _remember_members(self, chat_id: str, members: set):
+        with self._members_lock:
+            self._members[chat_id] = members
+            self._members.move_to_end(chat_id)
+            while len(self._members) > self._member_cache_size:
+                self._members.popitem(last=False)
+
+    def _update_members(self, chat_id: str, joined=(), left=()):
+        with self._members_lock:
+            members = self._members.get(chat_id)
+            if members is not None:
+                members.difference_update(left)
+                members.update(joined)
+
+    def save_group_user(self, chat_id: str, user_id: str):
+        self._ensure_migrated(chat_id)
+        # Keep the original join order if the user is already a member
+        db.reference(f'groups/{chat_id}/{user_id}').transaction(
+            lambda current: current if current is not None else _join_order()
+        )
+        self._update_members(chat_id, joined=[user_id])
+
+    def remove_group_user(self, chat_id: str, user_id: str):
+        self._ensure_migrated(chat_id)
+        db.reference(f'groups/{chat_id}/{user_id}').delete()
+        self._update_members(chat_id, left=[user_id])
+
+    def get_group_users(self, chat_id: str):
+        members = db.reference(f'groups/{chat_id}').get() or {}
+        if isinstance(members, list):
+            members = self._migrate_group(chat_id) or {}
+        else:
+            self._migrated_groups.add(chat_id)
+        self._remember_members(chat_id, set(members))
+        return [uid for uid, _ in sorted(members.items(), key=lambda item: (item[1], item[0]))]
+
+    def add_user_contribution(self, chat_id: str, user_id: str, platform: str, link: str = None):
+        db.reference().update({
+            f'group_contributions/{chat_id}/{user_id}/{platform}': link or True,
+            f'user_contributions/{user_id}/{chat_id}/{platform}': True,
+        })
+
+    def get_group_contributions(self, chat_id: str):
+        return db.reference(f'group_contributions/{chat_id}').get() or {}
+
+    def delete_user_contributions(self, chat_id: str, user_id: str):
+        db.reference().update({
+            f'group_contributions/{chat_id}/{user_id}': None,
+            f'user_contributions/{user_id}/{chat_id}': None,
+        })
+
+    def apply_group_changes(self, chat_id: str, joins: dict, leaves: list, contributions: dict, cleared: list):
+        self._ensure_migrated(chat_id)
+        updates = {}
+        new_members = {uid: order for uid, order in joins.items() if uid not in leaves}
+        if new_members:
+            # Members who are already in the group keep their original join order
+            existing = self._known_members(chat_id)
+            new_members = {uid: order for uid, order in new_members.items() if uid not in existing}
+        for uid in leaves:
+            # Leaving and joining again in one batch moves the member to the end
+            updates[f'groups/{chat_id}/{uid}'] = joins.get(uid)
+        for uid, order in new_members.items():
+            updates[f'groups/{chat_id}/{uid}'] = order
+        for uid in cleared:
+            platforms = contributions.get(uid) or {}
+            updates[f'group_contributions/{chat_id}/{uid}'] = {p: link or True for p, link in platforms.items()} or None
+            updates[f'user_contributions/{uid}/{chat_id}'] = dict.fromkeys(platforms, True) or None
+        for uid, platforms in contributions.items():
+            if uid not in cleared:
+                for platform, link in platforms.items():
+                    updates[f'group_contributions/{chat_id}/{uid}/{platform}'] = link or True
+                    updates[f'user_contributions/{uid}/{chat_id}/{platform}'] = True
+        if updates:
+            # One multi-path update for the whole batch
+            db.reference().update(updates)
+        self._update_members(chat_id, joined=joins, left=[uid for uid in leaves if uid not in joins])
+
+    def delete_group(self, chat_id: str):
+        contributors = db.reference(f'group_contributions/{chat_id}').get(shallow=True) or {}
+        updates = {f'user_contributions/{uid}/{chat_id}': None for uid in contributors}
+        db.reference().update({
+            **updates,
+            **{
+                f'{dataset}/{chat_id}': None
+                for dataset in ('groups', 'group_contributions', 'active_chains', 'chain_activity', 'chain_snapshots')
+            },
+        })
+        self._migrated_groups.discard(chat_id)
+        with self._members_lock:
+            self._members.pop(chat_id, None)
+
+    def reset_chat_state(self):
+        with self._members_lock:
+            self._members.clear()
+
+    # Track active chain messages in groups
+    def save_active_chain(self, chat_id: str, message_id: int):
+        ref = db.reference(f'active_chains/{chat_id}')
+        # Deactivate previous chain if it exists
+        previous_chain = ref.get()
+        # Save new active chain, stamped for maintenance in the same multi-path update
+        db.reference().update({
+            f'active_chains/{chat_id}': message_id,
+            f'chain_activity/{chat_id}': int(time.time()),
+        })
+        # Return the previous chain id if there was one
+        return previous_chain
+
+    def get_active_chain(self, chat_id: str):
+        return db.reference(f'active_chains/{chat_id}').get()
+
+    def get_chain_activity(self, chat_id: str):
+        return db.reference(f'chain_activity/{chat_id}').get()
+
+    # Denormalized copy of the rendered chain, so archiving needs a single read
+    def save_chain_snapshot(self, chat_id: str, message_id: int, lines: list, base_version: int, members: list = None):
+        result = {}
+
+        def update(current):
+            current_version = (current or {}).get('version', 0)
+            if current_version != base_version:
+                result['stale'] = True
+                return current
+            result['stale'] = False
+            return {
+                'version': base_version + 1,
+                'message_id': message_id,
+                'lines': lines,
+                'members': members or [],
+                'updated_at': int(time.time()),
+            }
+
+        db.reference(f'chain_snapshots/{chat_id}').transaction(update)
+        return None if result.get('stale') else base_version + 1
+
+    def get_chain_snapshot(self, chat_id: str):
+        return db.reference(f'chain_snapshots/{chat_id}').get()
+
+    # ------------- Conversation state -------------
+    def save_user_states(self, states: dict):
+        # Multi-path update: None values delete their child
+        db.reference('user_state').update(states)
+
+    # ------------- Bulk access -------------
+    def iter_records(self, dataset: str, batch_size: int = 500):
+        # Page through the children by key so the whole tree is never loaded at once
+        last_key = None
+        while True:
+            query = db.reference(dataset).order_by_key()
+            if last_key is not None:
+                query = query.start_at(last_key)
+            page = query.limit_to_first(batch_size + (last_key is not None)).get() or {}
+            records = [(key, value) for key, value in page.items() if key != last_key]
+            if not records:
+                return
+            if dataset == 'groups':
+                records = [
+                    (key, _members_from_list(value) if isinstance(value, list) else value)
+                    for key, value in records
+                ]
+            yield records
+            last_key = records[-1][0]
+
+    def write_records(self, dataset: str, records: list):
+        # One multi-path update per batch
+        updates = {f'{dataset}/{key}': value for key, value in records}
+        if dataset == 'group_contributions':
+            # With the index save_user_links uses to find the copies
+            for chat_id, contributions in records:
+                for uid, platforms in (contributions or {}).items():
+                    for platform, added in platforms.items():
+                        if added:
+                            updates[f'user_contributions/{uid}/{chat_id}/{platform}'] = True
+        db.reference().update(updates)
+
+    # ------------- Change streams -------------
+    def listen(self, path: str, callback):
+        # Streams over server-sent events on a background thread; the first event is a put
+        # of the whole subtree, then one put or patch per change
+        return db.reference(path).listen(callback)
+
+    def close(self):
+        self._batch_executor.shutdown(wait=True)
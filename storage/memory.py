@@ -0,0 +1,248 @@
+import time
+import copy
+import threading
+from storage.base import DATASETS, StorageBackend
+
+class Event:
+    """Change event shaped like firebase_admin.db.Event"""
+
+    __slots__ = ('event_type', 'path', 'data')
+
+    def __init__(self, event_type: str, path: str, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+class _Registration:
+    def __init__(self, listeners: list, callback):
+        self._listeners = listeners
+        self._callback = callback
+
+    def close(self):
+        if self._callback in self._listeners:
+            self._listeners.remove(self._callback)
+
+class MemoryBackend(StorageBackend):
+    """Process-local storage for tests and benchmarks.
+
+    `latency` (seconds) is slept on every call to mimic a remote database. listen()
+    emits the same put/patch events as a Firebase stream, so code that depends on
+    change events can run against it.
+    """
+
+    name = 'memory'
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._data = {dataset: {} for dataset in DATASETS}
+        self._last_join_order = 0
+        self._listeners = {dataset: [] for dataset in DATASETS}
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _emit(self, dataset: str, path: str, data, event_type: str = 'put'):
+        # Called after the write, outside the lock, like the Firebase stream thread
+        for callback in list(self._listeners[dataset]):
+            callback(Event(event_type, path, copy.deepcopy(data)))
+
+    # ------------- Users -------------
+    def _copy_links(self, links: dict):
+        # Point the contributions of these users at their new links; called with the lock held
+        copied = {}
+        for chat_id, group in self._data['group_contributions'].items():
+            for uid, platforms in links.items():
+                for platform, link in platforms.items():
+                    if platform in group.get(uid, {}):
+                        group[uid][platform] = link or True
+                        copied[f'{chat_id}/{uid}/{platform}'] = link or True
+        return copied
+
+    def save_user_links(self, user_id: str, platform: str, link: str):
+        self._round_trip()
+        with self._lock:
+            links = self._data['users'].setdefault(user_id, {})
+            if link is None:
+                links.pop(platform, None)
+            else:
+                links[platform] = link
+            if not links:
+                del self._data['users'][user_id]
+            copied = self._copy_links({user_id: {platform: link}})
+        self._emit('users', f'/{user_id}/{platform}', link)
+        if copied:
+            self._emit('group_contributions', '/', copied, event_type='patch')
+        return sorted({path.split('/')[0] for path in copied})
+
+    def save_users_links(self, links: dict):
+        self._round_trip()
+        with self._lock:
+            for uid, platforms in links.items():
+                self._data['users'].setdefault(uid, {}).update(platforms)
+            copied = self._copy_links(links)
+        self._emit('users', '/', {
+            f'{uid}/{platform}': link for uid, platforms in links.items() for platform, link in platforms.items()
+        }, event_type='patch')
+        if copied:
+            self._emit('group_contributions', '/', copied, event_type='patch')
+        return sorted({path.split('/')[0] for path in copied})
+
+    def get_user_links(self, user_id: str):
+        self._round_trip()
+        with self._lock:
+            links = self._data['users'].get(user_id)
+            return dict(links) if links is not None else None
+
+    def get_users_links(self, user_ids: list):
+        self._round_trip()
+        with self._lock:
+            users = self._data['users']
+            return {uid: dict(users.get(uid) or {}) for uid in user_ids}
+
+    # ------------- Groups -------------
+    def save_group_user(self, chat_id: str, user_id: str):
+        self._round_trip()
+        with self._lock:
+            members = self._data['groups'].setdefault(chat_id, {})
+            if user_id not in members:
+                # Same microsecond timestamps as the other backends, kept strictly increasing
+                self._last_join_order = max(time.time_ns() // 1000, self._last_join_order + 1)
+                members[user_id] = self._last_join_order
+
+    def remove_group_user(self, chat_id: str, user_id: str):
+        self._round_trip()
+        with self._lock:
+            self._data['groups'].get(chat_id, {}).pop(user_id, None)
+
+    def get_group_users(self, chat_id: str):
+        self._round_trip()
+        with self._lock:
+            members = self._data['groups'].get(chat_id, {})
+            return [uid for uid, _ in sorted(members.items(), key=lambda item: (item[1], item[0]))]
+
+    def add_user_contribution(self, chat_id: str, user_id: str, platform: str, link: str = None):
+        self._round_trip()
+        with self._lock:
+            group = self._data['group_contributions'].setdefault(chat_id, {})
+            group.setdefault(user_id, {})[platform] = link or True
+        self._emit('group_contributions', f'/{chat_id}/{user_id}/{platform}', link or True)
+
+    def get_group_contributions(self, chat_id: str):
+        self._round_trip()
+        with self._lock:
+            return copy.deepcopy(self._data['group_contributions'].get(chat_id, {}))
+
+    def delete_user_contributions(self, chat_id: str, user_id: str):
+        self._round_trip()
+        with self._lock:
+            self._data['group_contributions'].get(chat_id, {}).pop(user_id, None)
+        self._emit('group_contributions', f'/{chat_id}/{user_id}', None)
+
+    def apply_group_changes(self, chat_id: str, joins: dict, leaves: list, contributions: dict, cleared: list):
+        self._round_trip()
+        with self._lock:
+            members = self._data['groups'].setdefault(chat_id, {})
+            group = self._data['group_contributions'].setdefault(chat_id, {})
+            for uid in leaves:
+                members.pop(uid, None)
+            for uid in cleared:
+                group.pop(uid, None)
+            for uid, order in joins.items():
+                members.setdefault(uid, order)
+            for uid, platforms in contributions.items():
+                group.setdefault(uid, {}).update(platforms)
+            contributions_now = {uid: copy.deepcopy(group.get(uid)) for uid in set(cleared) | set(contributions)}
+        # The same patch a Firebase multi-path update would stream
+        if contributions_now:
+            self._emit('group_contributions', f'/{chat_id}', contributions_now, event_type='patch')
+
+    def delete_group(self, chat_id: str):
+        self._round_trip()
+        with self._lock:
+            for dataset in ('groups', 'group_contributions', 'active_chains', 'chain_activity', 'chain_snapshots'):
+                self._data[dataset].pop(chat_id, None)
+        self._emit('group_contributions', f'/{chat_id}', None)
+
+    # ------------- Active chains -------------
+    def save_active_chain(self, chat_id: str, message_id: int):
+        self._round_trip()
+        with self._lock:
+            previous_chain = self._data['active_chains'].get(chat_id)
+            self._data['active_chains'][chat_id] = message_id
+            self._data['chain_activity'][chat_id] = int(time.time())
+            return previous_chain
+
+    def get_active_chain(self, chat_id: str):
+        self._round_trip()
+        with self._lock:
+            return self._data['active_chains'].get(chat_id)
+
+    def get_chain_activity(self, chat_id: str):
+        self._round_trip()
+        with self._lock:
+            return self._data['chain_activity'].get(chat_id)
+
+    # ------------- Chain snapshots -------------
+    def save_chain_snapshot(self, chat_id: str, message_id: int, lines: list, base_version: int, members: list = None):
+        self._round_trip()
+        with self._lock:
+            current = self._data['chain_snapshots'].get(chat_id) or {}
+            if current.get('version', 0) != base_version:
+                return None
+            self._data['chain_snapshots'][chat_id] = {
+                'version': base_version + 1,
+                'message_id': message_id,
+                'lines': list(lines),
+                'members': list(members or []),
+                'updated_at': int(time.time()),
+            }
+            return base_version + 1
+
+    def get_chain_snapshot(self, chat_id: str):
+        self._round_trip()
+        with self._lock:
+            return copy.deepcopy(self._data['chain_snapshots'].get(chat_id))
+
+    # ------------- Conversation state -------------
+    def save_user_states(self, states: dict):
+        self._round_trip()
+        with self._lock:
+            for user_id, state in states.items():
+                if state is None:
+                    self._data['user_state'].pop(user_id, None)
+                else:
+                    self._data['user_state'][user_id] = dict(state)
+
+    # ------------- Bulk access -------------
+    def iter_records(self, dataset: str, batch_size: int = 500):
+        with self._lock:
+            keys = sorted(self._data[dataset])
+        for start in range(0, len(keys), batch_size):
+            with self._lock:
+                records = [
+                    (key, copy.deepcopy(self._data[dataset][key]))
+                    for key in keys[start:start + batch_size]
+                    if key in self._data[dataset]
+                ]
+            yield records
+
+    def write_records(self, dataset: str, records: list):
+        with self._lock:
+            for key, value in records:
+                self._data[dataset][key] = copy.deepcopy(value)
+        self._emit(dataset, '/', dict(records), event_type='patch')
+
+    # ------------- Change streams -------------
+    def listen(self, path: str, callback):
+        listeners = self._listeners[path.strip('/')]
+        with self._lock:
+            initial = copy.deepcopy(self._data[path.strip('/')])
+        # Like Firebase, the stream opens with a put of the whole subtree
+        callback(Event('put', '/', initial or None))
+        listeners.append(callback)
+        return _Registration(listeners, callback)
@@ -0,0 +1,49 @@
+"""Copy all bot data from one storage backend to another.
+
+    python -m storage.migrate firebase sqlite --target-path linklist.db
+
+Records are streamed in batches, so the source is never loaded into memory at once.
+"""
+import argparse
+import logging
+from dotenv import load_dotenv
+from storage import DATASETS, create_backend
+
+def migrate(source, target, batch_size: int = 500, datasets=DATASETS):
+    copied = {}
+    for dataset in datasets:
+        copied[dataset] = 0
+        for records in source.iter_records(dataset, batch_size):
+            target.write_records(dataset, records)
+            copied[dataset] += len(records)
+            logging.info(f"{dataset}: copied {copied[dataset]} records")
+    return copied
+
+def _backend_options(name: str, path: str):
+    return {'path': path} if name == 'sqlite' and path else {}
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy LinkListBot data between storage backends")
+    parser.add_argument("source", choices=["firebase", "sqlite", "memory"])
+    parser.add_argument("target", choices=["firebase", "sqlite", "memory"])
+    parser.add_argument("--source-path", help="SQLite file to read from")
+    parser.add_argument("--target-path", help="SQLite file to write to")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dataset", action="append", choices=DATASETS,
+                        help="Only copy this data set (can be repeated)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    source = create_backend(args.source, **_backend_options(args.source, args.source_path))
+    target = create_backend(args.target, **_backend_options(args.target, args.target_path))
+    try:
+        copied = migrate(source, target, args.batch_size, args.dataset or DATASETS)
+    finally:
+        source.close()
+        target.close()
+    print(", ".join(f"{dataset}: {count}" for dataset, count in copied.items()))
+
+if __name__ == '__main__':
+    main()
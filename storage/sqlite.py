@@ -0,0 +1,357 @@
+import json
+import time
+import sqlite3
+import threading
+from storage.base import StorageBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    link TEXT NOT NULL,
+    PRIMARY KEY (user_id, platform)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS group_members (
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    join_order INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS group_members_order ON group_members (chat_id, join_order);
+
+CREATE TABLE IF NOT EXISTS group_contributions (
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    link TEXT,
+    PRIMARY KEY (chat_id, user_id, platform)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS group_contributions_user ON group_contributions (user_id, platform);
+
+CREATE TABLE IF NOT EXISTS active_chains (
+    chat_id TEXT PRIMARY KEY,
+    message_id INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS chain_activity (
+    chat_id TEXT PRIMARY KEY,
+    started_at INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS chain_snapshots (
+    chat_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    lines TEXT NOT NULL,
+    updated_at INTEGER NOT NULL,
+    members TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Columns added after their table, for databases created before them
+COLUMNS = (('chain_snapshots', 'members'), ('group_contributions', 'link'))
+
+_UPSERT_CONTRIBUTION = (
+    "INSERT INTO group_contributions (chat_id, user_id, platform, link) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (chat_id, user_id, platform) DO UPDATE SET link = excluded.link"
+)
+
+def _join_order():
+    return time.time_ns() // 1000
+
+def _link(value):
+    # Contributions written before links were copied are stored as True; they keep a NULL link
+    return value if isinstance(value, str) else None
+
+class SQLiteBackend(StorageBackend):
+    """Embedded SQLite database in WAL mode for self-hosting"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str = 'linklist.db'):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            for table, column in COLUMNS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared across threads, so each pool thread gets its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    # ------------- Users -------------
+    def _copy_links(self, conn, rows: list):
+        # Point the contributions of (link, user_id, platform) rows at the new links
+        chats = set()
+        for _, user_id, platform in rows:
+            chats.update(chat_id for (chat_id,) in conn.execute(
+                "SELECT chat_id FROM group_contributions WHERE user_id = ? AND platform = ?", (user_id, platform)
+            ))
+        conn.executemany("UPDATE group_contributions SET link = ? WHERE user_id = ? AND platform = ?", rows)
+        return sorted(chats)
+
+    def save_user_links(self, user_id: str, platform: str, link: str):
+        with self._connect() as conn:
+            if link is None:
+                conn.execute("DELETE FROM users WHERE user_id = ? AND platform = ?", (user_id, platform))
+            else:
+                conn.execute(
+                    "INSERT INTO users (user_id, platform, link) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id, platform) DO UPDATE SET link = excluded.link",
+                    (user_id, platform, link)
+                )
+            return self._copy_links(conn, [(link, user_id, platform)])
+
+    def save_users_links(self, links: dict):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO users (user_id, platform, link) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, platform) DO UPDATE SET link = excluded.link",
+                [(uid, platform, link) for uid, platforms in links.items() for platform, link in platforms.items()]
+            )
+            return self._copy_links(conn, [
+                (link, uid, platform) for uid, platforms in links.items() for platform, link in platforms.items()
+            ])
+
+    def get_user_links(self, user_id: str):
+        rows = self._connect().execute(
+            "SELECT platform, link FROM users WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        return dict(rows) or None
+
+    def get_users_links(self, user_ids: list):
+        links = {uid: {} for uid in user_ids}
+        conn = self._connect()
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT user_id, platform, link FROM users WHERE user_id IN ({placeholders})", chunk
+            )
+            for uid, platform, link in rows:
+                links[uid][platform] = link
+        return links
+
+    # ------------- Groups -------------
+    def save_group_user(self, chat_id: str, user_id: str):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO group_members (chat_id, user_id, join_order) VALUES (?, ?, ?)",
+                (chat_id, user_id, _join_order())
+            )
+
+    def remove_group_user(self, chat_id: str, user_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM group_members WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+
+    def get_group_users(self, chat_id: str):
+        rows = self._connect().execute(
+            "SELECT user_id FROM group_members WHERE chat_id = ? ORDER BY join_order, user_id", (chat_id,)
+        )
+        return [uid for (uid,) in rows]
+
+    def add_user_contribution(self, chat_id: str, user_id: str, platform: str, link: str = None):
+        with self._connect() as conn:
+            conn.execute(_UPSERT_CONTRIBUTION, (chat_id, user_id, platform, _link(link)))
+
+    def get_group_contributions(self, chat_id: str):
+        contributions = {}
+        rows = self._connect().execute(
+            "SELECT user_id, platform, link FROM group_contributions WHERE chat_id = ?", (chat_id,)
+        )
+        for uid, platform, link in rows:
+            contributions.setdefault(uid, {})[platform] = link or True
+        return contributions
+
+    def delete_user_contributions(self, chat_id: str, user_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM group_contributions WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+
+    def apply_group_changes(self, chat_id: str, joins: dict, leaves: list, contributions: dict, cleared: list):
+        # One transaction for the whole batch
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM group_members WHERE chat_id = ? AND user_id = ?", [(chat_id, uid) for uid in leaves]
+            )
+            conn.executemany(
+                "DELETE FROM group_contributions WHERE chat_id = ? AND user_id = ?", [(chat_id, uid) for uid in cleared]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO group_members (chat_id, user_id, join_order) VALUES (?, ?, ?)",
+                [(chat_id, uid, order) for uid, order in joins.items()]
+            )
+            conn.executemany(_UPSERT_CONTRIBUTION, [
+                (chat_id, uid, platform, _link(link))
+                for uid, platforms in contributions.items() for platform, link in platforms.items()
+            ])
+
+    def delete_group(self, chat_id: str):
+        with self._connect() as conn:
+            for table in ('group_members', 'group_contributions', 'active_chains', 'chain_activity', 'chain_snapshots'):
+                conn.execute(f"DELETE FROM {table} WHERE chat_id = ?", (chat_id,))
+
+    # ------------- Active chains -------------
+    def save_active_chain(self, chat_id: str, message_id: int):
+        with self._connect() as conn:
+            row = conn.execute("SELECT message_id FROM active_chains WHERE chat_id = ?", (chat_id,)).fetchone()
+            conn.execute(
+                "INSERT INTO active_chains (chat_id, message_id) VALUES (?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET message_id = excluded.message_id",
+                (chat_id, message_id)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO chain_activity (chat_id, started_at) VALUES (?, ?)", (chat_id, int(time.time()))
+            )
+        return row[0] if row else None
+
+    def get_active_chain(self, chat_id: str):
+        row = self._connect().execute("SELECT message_id FROM active_chains WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_chain_activity(self, chat_id: str):
+        row = self._connect().execute("SELECT started_at FROM chain_activity WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    # ------------- Chain snapshots -------------
+    def save_chain_snapshot(self, chat_id: str, message_id: int, lines: list, base_version: int, members: list = None):
+        conn = self._connect()
+        with conn:
+            # Take the write lock before reading so the version check and write are atomic
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT version FROM chain_snapshots WHERE chat_id = ?", (chat_id,)).fetchone()
+            if (row[0] if row else 0) != base_version:
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO chain_snapshots (chat_id, version, message_id, lines, updated_at, members) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, base_version + 1, message_id, json.dumps(lines), int(time.time()), json.dumps(members or []))
+            )
+        return base_version + 1
+
+    def get_chain_snapshot(self, chat_id: str):
+        row = self._connect().execute(
+            "SELECT version, message_id, lines, updated_at, members FROM chain_snapshots WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        version, message_id, lines, updated_at, members = row
+        return {
+            'version': version, 'message_id': message_id, 'lines': json.loads(lines),
+            'members': json.loads(members or '[]'), 'updated_at': updated_at,
+        }
+
+    # ------------- Conversation state -------------
+    def save_user_states(self, states: dict):
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM user_state WHERE user_id = ?", [(uid,) for uid, state in states.items() if state is None]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO user_state (user_id, state) VALUES (?, ?)",
+                [(uid, json.dumps(state, separators=(',', ':'))) for uid, state in states.items() if state is not None]
+            )
+
+    # ------------- Bulk access -------------
+    _KEY_QUERIES = {
+        'users': "SELECT DISTINCT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+        'groups': "SELECT DISTINCT chat_id FROM group_members WHERE chat_id > ? ORDER BY chat_id LIMIT ?",
+        'group_contributions': "SELECT DISTINCT chat_id FROM group_contributions WHERE chat_id > ? ORDER BY chat_id LIMIT ?",
+        'active_chains': "SELECT chat_id FROM active_chains WHERE chat_id > ? ORDER BY chat_id LIMIT ?",
+        'chain_activity': "SELECT chat_id FROM chain_activity WHERE chat_id > ? ORDER BY chat_id LIMIT ?",
+        'chain_snapshots': "SELECT chat_id FROM chain_snapshots WHERE chat_id > ? ORDER BY chat_id LIMIT ?",
+        'user_state': "SELECT user_id FROM user_state WHERE user_id > ? ORDER BY user_id LIMIT ?",
+    }
+
+    def _load(self, dataset: str, key: str):
+        conn = self._connect()
+        if dataset == 'users':
+            return self.get_user_links(key) or {}
+        if dataset == 'groups':
+            rows = conn.execute("SELECT user_id, join_order FROM group_members WHERE chat_id = ?", (key,))
+            return dict(rows)
+        if dataset == 'group_contributions':
+            return self.get_group_contributions(key)
+        if dataset == 'chain_snapshots':
+            return self.get_chain_snapshot(key)
+        if dataset == 'chain_activity':
+            return self.get_chain_activity(key)
+        if dataset == 'user_state':
+            row = conn.execute("SELECT state FROM user_state WHERE user_id = ?", (key,)).fetchone()
+            return json.loads(row[0]) if row else None
+        return self.get_active_chain(key)
+
+    def iter_records(self, dataset: str, batch_size: int = 500):
+        # Keyset pagination keeps memory bounded however large the table is
+        last_key = ""
+        while True:
+            keys = [key for (key,) in self._connect().execute(self._KEY_QUERIES[dataset], (last_key, batch_size))]
+            if not keys:
+                return
+            yield [(key, self._load(dataset, key)) for key in keys]
+            last_key = keys[-1]
+
+    def write_records(self, dataset: str, records: list):
+        with self._connect() as conn:
+            for key, value in records:
+                if dataset == 'users':
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO users (user_id, platform, link) VALUES (?, ?, ?)",
+                        [(key, platform, link) for platform, link in value.items() if link is not None]
+                    )
+                elif dataset == 'groups':
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO group_members (chat_id, user_id, join_order) VALUES (?, ?, ?)",
+                        [(key, uid, order) for uid, order in value.items()]
+                    )
+                elif dataset == 'group_contributions':
+                    conn.executemany(_UPSERT_CONTRIBUTION, [
+                        (key, uid, platform, _link(added))
+                        for uid, platforms in value.items()
+                        for platform, added in platforms.items() if added
+                    ])
+                elif dataset == 'chain_snapshots':
+                    conn.execute(
+                        "INSERT OR REPLACE INTO chain_snapshots (chat_id, version, message_id, lines, updated_at, members) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, value['version'], value['message_id'], json.dumps(value.get('lines') or []),
+                         value.get('updated_at') or 0, json.dumps(value.get('members') or []))
+                    )
+                elif dataset == 'chain_activity':
+                    conn.execute(
+                        "INSERT OR REPLACE INTO chain_activity (chat_id, started_at) VALUES (?, ?)", (key, value)
+                    )
+                elif dataset == 'user_state':
+                    conn.execute(
+                        "INSERT OR REPLACE INTO user_state (user_id, state) VALUES (?, ?)",
+                        (key, json.dumps(value, separators=(',', ':')))
+                    )
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO active_chains (chat_id, message_id) VALUES (?, ?)", (key, value)
+                    )
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
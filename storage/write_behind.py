@@ -0,0 +1,148 @@
+import time
+
+class _Pending:
+    """Net effect of one member's not-yet-written chain changes"""
+
+    __slots__ = ('joined', 'left', 'join_order', 'platforms', 'cleared')
+
+    def __init__(self):
+        self.joined = False
+        self.left = False
+        self.join_order = None
+        # {platform: link}
+        self.platforms = {}
+        self.cleared = False
+
+    def merge_newer(self, newer: '_Pending'):
+        """Fold changes made after this batch on top of it (used when a flush is put back)"""
+        if newer.left:
+            self.joined, self.left, self.join_order = newer.joined, True, newer.join_order
+        elif newer.joined:
+            if not self.joined:
+                self.join_order = newer.join_order
+            self.joined = True
+        if newer.cleared:
+            self.cleared = True
+            self.platforms = dict(newer.platforms)
+        else:
+            self.platforms.update(newer.platforms)
+
+class GroupWriteBuffer:
+    """Chain writes (joins, leaves and contributions) held per chat until they are flushed.
+
+    Repeated changes by the same member collapse into their net effect, so a burst of
+    taps in one chat becomes a single apply_group_changes() call. Reads merge the
+    pending changes over what storage returns, so the bot always sees its own writes.
+    """
+
+    def __init__(self):
+        self._chats = {}
+        # Changes taken for a flush that has not finished yet; reads still see them
+        self._in_flight = {}
+        self._last_join_order = 0
+
+    def __len__(self):
+        return sum(len(members) for members in self._chats.values())
+
+    def chats(self):
+        # A chat with a flush in flight waits for it, so its writes stay in order
+        return [chat_id for chat_id in self._chats if chat_id not in self._in_flight]
+
+    def in_flight(self):
+        return list(self._in_flight)
+
+    def pending(self, chat_id: str):
+        return len(self._chats.get(chat_id, ()))
+
+    def _member(self, chat_id: str, user_id: str):
+        members = self._chats.setdefault(chat_id, {})
+        pending = members.get(user_id)
+        if pending is None:
+            pending = members[user_id] = _Pending()
+        return pending
+
+    def _next_join_order(self):
+        # Microsecond timestamps like the backends, kept strictly increasing
+        self._last_join_order = max(time.time_ns() // 1000, self._last_join_order + 1)
+        return self._last_join_order
+
+    # ------------- Recording -------------
+    def join(self, chat_id: str, user_id: str):
+        pending = self._member(chat_id, user_id)
+        if not pending.joined:
+            pending.joined = True
+            pending.join_order = self._next_join_order()
+
+    def leave(self, chat_id: str, user_id: str):
+        pending = self._member(chat_id, user_id)
+        pending.joined = False
+        pending.left = True
+        pending.join_order = None
+
+    def contribute(self, chat_id: str, user_id: str, platform: str, link: str):
+        self._member(chat_id, user_id).platforms[platform] = link
+
+    def update_link(self, user_id: str, platform: str, link: str):
+        """Re-point pending contributions at a link the user just changed"""
+        for members in self._chats.values():
+            pending = members.get(user_id)
+            if pending is not None and platform in pending.platforms:
+                pending.platforms[platform] = link or True
+
+    def clear_contributions(self, chat_id: str, user_id: str):
+        pending = self._member(chat_id, user_id)
+        pending.cleared = True
+        pending.platforms.clear()
+
+    # ------------- Reading through -------------
+    def _layers(self, chat_id: str):
+        return [layer for layer in (self._in_flight.get(chat_id), self._chats.get(chat_id)) if layer]
+
+    def overlay_members(self, chat_id: str, members: list):
+        for pending in self._layers(chat_id):
+            # Members who left (or left and came back) lose their place
+            members = [uid for uid in members if uid not in pending or not pending[uid].left]
+            present = set(members)
+            joined = sorted(
+                (p.join_order, uid) for uid, p in pending.items() if p.joined and uid not in present
+            )
+            members += [uid for _, uid in joined]
+        return members
+
+    def overlay_contributions(self, chat_id: str, contributions: dict):
+        for pending in self._layers(chat_id):
+            contributions = dict(contributions)
+            for uid, p in pending.items():
+                platforms = {} if p.cleared else dict(contributions.get(uid) or {})
+                platforms.update(p.platforms)
+                if platforms:
+                    contributions[uid] = platforms
+                else:
+                    contributions.pop(uid, None)
+        return contributions
+
+    # ------------- Flushing -------------
+    def take(self, chat_id: str):
+        """Move one chat's changes in flight and return them as apply_group_changes() arguments"""
+        members = self._chats.pop(chat_id, None) or {}
+        self._in_flight[chat_id] = members
+        return {
+            'joins': {uid: p.join_order for uid, p in members.items() if p.joined},
+            'leaves': [uid for uid, p in members.items() if p.left],
+            'contributions': {uid: dict(p.platforms) for uid, p in members.items() if p.platforms},
+            'cleared': [uid for uid, p in members.items() if p.cleared],
+        }
+
+    def done(self, chat_id: str):
+        self._in_flight.pop(chat_id, None)
+
+    def restore(self, chat_id: str):
+        """Put back changes whose flush failed, under anything recorded since"""
+        members = self._in_flight.pop(chat_id, None) or {}
+        newer = self._chats.get(chat_id) or {}
+        for uid, pending in newer.items():
+            if uid in members:
+                members[uid].merge_newer(pending)
+            else:
+                members[uid] = pending
+        self._chats[chat_id] = members
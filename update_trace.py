@@ -0,0 +1,86 @@
+"""Opt-in recording of incoming updates for offline replay (bench/replay.py).
+
+With TRACE_PATH set, every update is appended to a gzip-compressed JSONL file as
+{"ts": arrival time, "ms": handling time, "update": the update as Telegram sent it}.
+Records are buffered and written TRACE_FLUSH_EVERY at a time; each write appends a
+complete gzip member, so a trace stays readable if the bot stops abruptly.
+Traces contain user messages and ids: keep them private and delete them when done.
+"""
+import os
+import gzip
+import json
+import time
+import logging
+from collections import OrderedDict
+from telegram import Update
+from telegram.ext import TypeHandler
+
+TRACE_PATH = os.getenv("TRACE_PATH")
+TRACE_FLUSH_EVERY = int(os.getenv("TRACE_FLUSH_EVERY", "100"))
+
+# Handler groups around the bot's own handlers (-1 and 0)
+_FIRST_GROUP = -100
+_LAST_GROUP = 100
+
+def read_trace(path: str):
+    """Yield the records of a trace file in the order they were written"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+class UpdateRecorder:
+    def __init__(self, path: str, flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        self.recorded = 0
+        self._buffer = []
+        # update_id -> (arrival time, perf_counter at arrival) until the update is handled
+        self._started = OrderedDict()
+
+    async def _begin(self, update: Update, context):
+        self._started[update.update_id] = (time.time(), time.perf_counter())
+        # Updates whose last group never ran (e.g. ApplicationHandlerStop) are not kept forever
+        while len(self._started) > 10000:
+            self._started.popitem(last=False)
+
+    async def _end(self, update: Update, context):
+        started = self._started.pop(update.update_id, None)
+        if started is None:
+            return
+        ts, start = started
+        self._buffer.append(json.dumps(
+            {'ts': round(ts, 6), 'ms': round((time.perf_counter() - start) * 1000, 3), 'update': update.to_dict()},
+            separators=(',', ':'), ensure_ascii=False,
+        ))
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            self.recorded += len(lines)
+        except OSError as e:
+            logging.error(f"Could not write {len(lines)} updates to {self.path}: {e}")
+
+    def install(self, app):
+        """Time every update from before the first handler group to after the last"""
+        app.add_handler(TypeHandler(Update, self._begin, block=True), group=_FIRST_GROUP)
+        app.add_handler(TypeHandler(Update, self._end, block=True), group=_LAST_GROUP)
+
+recorder = None
+
+def install(app, path: str = None):
+    global recorder
+    recorder = UpdateRecorder(path or TRACE_PATH, TRACE_FLUSH_EVERY)
+    recorder.install(app)
+    logging.info(f"Recording updates to {recorder.path}")
+    return recorder
+
+def close():
+    if recorder is not None:
+        recorder.flush()
@@ -0,0 +1,24 @@
+import re
+
+# The rules the private setup flow applies to what users send, shared with the importer
+LINKEDIN_PATTERN = re.compile(r"linkedin\.com/(in|pub|company)/[\w\-]+", re.IGNORECASE)
+INSTAGRAM_PATTERN = re.compile(r"instagram\.com/([\w\.]+)", re.IGNORECASE)
+INSTAGRAM_USERNAME_PATTERN = re.compile(r"^@([\w\.]+)$")
+
+def linkedin_link(text: str):
+    """The LinkedIn link to store for text, or None if it is not one"""
+    text = text.strip()
+    if LINKEDIN_PATTERN.search(text):
+        return text
+    return None
+
+def instagram_link(text: str):
+    """The Instagram link to store for text (an @username becomes a link), or None"""
+    text = text.strip()
+    username_match = INSTAGRAM_USERNAME_PATTERN.match(text)
+    if username_match:
+        return f"https://instagram.com/{username_match.group(1)}"
+    if INSTAGRAM_PATTERN.search(text):
+        # Already a proper Instagram link, so no need for reformatting
+        return text
+    return None
@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import bisect
+import queue
+import asyncio
+import signal
+import hashlib
+import logging
+import collections
+import multiprocessing
+from dispatcher import serialization_key
+
+# Set in worker processes only: where published events go, and the front's ring as of
+# the last reset
+_worker_id = None
+_events = None
+_ring = None
+
+# ------------- Consistent hashing -------------
+def _hash(value: str):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+class HashRing:
+    """Consistent hash ring: removing a worker only moves the keys it owned"""
+
+    def __init__(self, replicas: int = 64):
+        self.replicas = replicas
+        self._points = []
+        self._owners = {}
+
+    def __len__(self):
+        return len(set(self._owners.values()))
+
+    def add(self, worker_id: int):
+        for replica in range(self.replicas):
+            point = _hash(f"{worker_id}:{replica}")
+            self._owners[point] = worker_id
+            bisect.insort(self._points, point)
+
+    def members(self):
+        return sorted(set(self._owners.values()))
+
+    def remove(self, worker_id: int):
+        self._points = [point for point in self._points if self._owners[point] != worker_id]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != worker_id}
+
+    def owner(self, key: str):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+# ------------- Worker side -------------
+def publish(name: str, *args):
+    """Tell the other workers about a change to shared state; no-op outside worker mode"""
+    if _events is not None:
+        _events.put(('publish', _worker_id, name, args))
+
+def owns_chat(chat_id: str):
+    """Whether updates for this group reach this process; always true outside worker mode.
+
+    Work done outside of updates (maintenance) uses this so that each chat's in-memory
+    state is only ever changed by the worker that holds it.
+    """
+    if _worker_id is None:
+        return True
+    return _ring is not None and _ring.owner(f"chat:{chat_id}") == _worker_id
+
+def _set_ring(members: list):
+    global _ring
+    _ring = HashRing()
+    for worker_id in members:
+        _ring.add(worker_id)
+
+def _apply_event(name: str, args: tuple):
+    import storage
+    import chain_view
+    from models import Platform
+    if name == 'link':
+        user_id, platform, link, chats = args
+        storage.note_user_link(user_id, platform, link, chats)
+        chain_view.views.update_link(user_id, Platform.from_name(platform), link)
+    elif name == 'links':
+        # A batch of imported links: drop rendered chains as the importing worker does
+        (links,) = args
+        storage.note_user_links(links)
+        chain_view.views.clear()
+
+async def _reset(app):
+    # Chats may have moved between workers: drop per-chat state and re-read it from storage
+    import storage
+    import chain_view
+    await storage.flush_writes()
+    storage.reset_chat_state()
+    chain_view.views.clear()
+    if app.persistence is not None:
+        # Same for the setup flow of users whose private chats moved
+        await app.update_persistence()
+        await app.persistence.reload()
+
+async def _serve(worker_id: int, updates, events):
+    import bot
+    import storage
+    from telegram import Update
+
+    app = bot.build_application(fetch_updates=False)
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    events.put(('ready', worker_id))
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            message = await loop.run_in_executor(None, updates.get)
+            kind = message[0]
+            if kind == 'update':
+                _, seq, payload = message
+                await app.update_queue.put(Update.de_json(json.loads(payload), app.bot))
+                # The front re-routes only what was never received, so nothing runs twice
+                events.put(('ack', worker_id, seq))
+            elif kind == 'event':
+                _apply_event(*message[1:])
+            elif kind == 'reset':
+                _set_ring(message[1])
+                await _reset(app)
+            elif kind == 'stop':
+                break
+    finally:
+        await app.stop()
+        await app.post_shutdown(app)
+        await app.shutdown()
+        storage.shutdown()
+
+def worker_main(worker_id: int, updates, events):
+    global _worker_id, _events
+    _worker_id, _events = worker_id, events
+    # Ctrl+C reaches the whole process group; the front stops workers in order instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # One metrics endpoint per worker. Every worker runs maintenance, for the chats it owns.
+    if os.getenv("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + 1 + worker_id)
+    # One trace file per worker; bench/replay.py merges them
+    if os.getenv("TRACE_PATH"):
+        os.environ["TRACE_PATH"] = f"{os.environ['TRACE_PATH']}.worker{worker_id}"
+    logging.basicConfig(
+        format=f'%(asctime)s - worker {worker_id} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+        force=True
+    )
+    asyncio.run(_serve(worker_id, updates, events))
+
+# ------------- Front dispatcher -------------
+class _Worker:
+    __slots__ = ('worker_id', 'process', 'updates', 'restarts', 'in_transit')
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process = None
+        self.updates = None
+        self.restarts = []
+        # (seq, update) sent but not yet acknowledged
+        self.in_transit = collections.deque()
+
+class WorkerPool:
+    """Front dispatcher: routes each update to the worker that owns its chat.
+
+    Group chats are keyed by chat id and private chats by user id (the same keys the
+    in-process update processor serializes on), so a chain's state lives on one
+    worker. A worker that dies is taken out of the ring, its undelivered updates are
+    routed again and it is restarted; after MAX_RESTARTS within RESTART_WINDOW
+    seconds it stays out and its chats remain with the others.
+    """
+
+    MAX_RESTARTS = 5
+    RESTART_WINDOW = 60
+
+    def __init__(self, count: int):
+        self._context = multiprocessing.get_context('spawn')
+        self._events = self._context.Queue()
+        self._workers = [_Worker(worker_id) for worker_id in range(count)]
+        self.ring = HashRing()
+        self._seq = 0
+        self.routed = 0
+        self.rerouted = 0
+
+    def _spawn(self, worker: _Worker):
+        worker.updates = self._context.Queue()
+        worker.process = self._context.Process(
+            target=worker_main, args=(worker.worker_id, worker.updates, self._events),
+            name=f"linklist-worker-{worker.worker_id}", daemon=True,
+        )
+        worker.process.start()
+
+    def start(self):
+        for worker in self._workers:
+            self._spawn(worker)
+
+    def _broadcast(self, message, skip: int = None):
+        for worker in self._workers:
+            if worker.worker_id != skip and worker.worker_id in self._live():
+                worker.updates.put(message)
+
+    def _live(self):
+        return {worker.worker_id for worker in self._workers if worker.process is not None and worker.process.is_alive()}
+
+    def _rebalanced(self):
+        logging.info(f"Routing to {len(self.ring)} of {len(self._workers)} workers")
+        # Workers get the ring too, to tell which chats are theirs
+        self._broadcast(('reset', self.ring.members()))
+
+    def route(self, update):
+        worker_id = self.ring.owner(serialization_key(update))
+        if worker_id is None:
+            return False
+        worker = self._workers[worker_id]
+        self._seq += 1
+        worker.in_transit.append((self._seq, update))
+        worker.updates.put(('update', self._seq, update.to_json()))
+        self.routed += 1
+        return True
+
+    def _handle_event(self, event):
+        if event[0] == 'ready':
+            self.ring.add(event[1])
+            self._rebalanced()
+        elif event[0] == 'ack':
+            _, worker_id, seq = event
+            in_transit = self._workers[worker_id].in_transit
+            while in_transit and in_transit[0][0] <= seq:
+                in_transit.popleft()
+        elif event[0] == 'publish':
+            _, source, name, args = event
+            self._broadcast(('event', name, args), skip=source)
+
+    def _check_workers(self):
+        for worker in self._workers:
+            if worker.process is None or worker.process.is_alive():
+                continue
+            logging.error(f"Worker {worker.worker_id} exited with code {worker.process.exitcode}")
+            self.ring.remove(worker.worker_id)
+            self._rebalanced()
+            # Updates it never received go to the workers that now own their chats. Its
+            # queue may be locked by the dead reader, so they come from the in-transit list.
+            pending = [update for _, update in worker.in_transit]
+            worker.in_transit.clear()
+            worker.process = None
+            for update in pending:
+                if self.route(update):
+                    self.rerouted += 1
+            if pending:
+                logging.warning(f"Re-routed {len(pending)} updates from worker {worker.worker_id}")
+
+            now = time.monotonic()
+            worker.restarts = [at for at in worker.restarts if now - at < self.RESTART_WINDOW] + [now]
+            if len(worker.restarts) > self.MAX_RESTARTS:
+                logging.error(f"Worker {worker.worker_id} keeps failing, leaving it stopped")
+                continue
+            self._spawn(worker)
+
+    async def run(self, update_queue: asyncio.Queue):
+        """Route updates from update_queue until cancelled"""
+        async def watch():
+            while True:
+                while True:
+                    try:
+                        event = self._events.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._handle_event(event)
+                self._check_workers()
+                await asyncio.sleep(0.2)
+
+        watcher = asyncio.create_task(watch())
+        try:
+            while True:
+                update = await update_queue.get()
+                # Until a worker is ready there is nowhere to send updates, so they wait here
+                while not self.route(update):
+                    await asyncio.sleep(0.2)
+        finally:
+            watcher.cancel()
+
+    def stop(self, timeout: float = 30):
+        self._broadcast(('stop',))
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(max(0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.terminate()
+
+async def _run_front(pool: WorkerPool, token: str, mode: str, webhook_options: dict, base_url: str = None):
+    from telegram import Bot
+    from telegram.ext import Updater
+
+    # Stop in order on SIGTERM too (what process managers send), so workers can flush
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    bot = Bot(token, base_url=base_url) if base_url else Bot(token)
+    update_queue = asyncio.Queue()
+    updater = Updater(bot, update_queue)
+    async with updater:
+        if mode == 'webhook':
+            await updater.start_webhook(**webhook_options)
+        else:
+            await updater.start_polling()
+        try:
+            await pool.run(update_queue)
+        finally:
+            await updater.stop()
+
+def run(count: int, token: str, mode: str, webhook_options: dict = None, base_url: str = None):
+    """Run the front dispatcher with count worker processes until interrupted"""
+    if os.getenv("STORAGE_BACKEND", "firebase").lower() == 'memory':
+        raise SystemExit("WORKERS > 1 needs storage shared between processes (firebase or sqlite)")
+    pool = WorkerPool(count)
+    pool.start()
+    try:
+        asyncio.run(_run_front(pool, token, mode, webhook_options or {}, base_url))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        pool.stop()